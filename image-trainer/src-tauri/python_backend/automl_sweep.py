@@ -4,25 +4,33 @@ Standalone script that runs N mini-trials to find optimal hyperparameters.
 Outputs JSON status lines to stdout for the EPOQ frontend.
 """
 import sys
-import json
 import os
+import time
 import argparse
 import subprocess
+import importlib.util
 
-def emit(obj):
-    """Print JSON to stdout for frontend consumption."""
-    print(json.dumps(obj), flush=True)
+from status_output import emit
+
+if __name__ == "__main__" and '--profile_imports' in sys.argv:
+    # Started before the heavy imports below so that they are measured
+    import import_profiler
+    import_profiler.start()
 
 def _install_missing(module_name, pip_name=None):
     if pip_name is None:
         pip_name = module_name
-    try:
-        __import__(module_name)
-    except ImportError:
+    # find_spec locates the package without importing (executing) it
+    if importlib.util.find_spec(module_name) is None:
         emit({"status": "automl_info", "message": f"Installing missing dependency: {pip_name}..."})
         subprocess.check_call([sys.executable, "-m", "pip", "install", pip_name])
 
-
+if __name__ == "__main__":
+    # Checked before the imports below, which need them
+    _install_missing("optuna")
+    _install_missing("torch")
+    _install_missing("torchvision")
+    _install_missing("sklearn", "scikit-learn")
 
 import optuna
 optuna.logging.set_verbosity(optuna.logging.WARNING)
@@ -30,15 +38,27 @@ optuna.logging.set_verbosity(optuna.logging.WARNING)
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torchvision import datasets, transforms
+from torchvision import transforms
 from torch.utils.data import DataLoader, Subset
 
+from image_datasets import open_image_folder, is_packed_dataset, load_manifest, train_sampling
+from image_decode import DECODE_BACKENDS, make_loader
+from precision import PRECISIONS, autocast, prepare_inputs, prepare_model
+from metrics import EpochMetrics
+from resource_planner import CPU_PLANS, apply_plan, available_cpus, default_loader_workers, make_plan
 
 
 
 
-def build_dataloaders(data_dir, batch_size, num_workers):
-    """Build train/val DataLoaders reusing the same logic as script.py."""
+
+def build_dataloaders(data_dir, batch_size, num_workers, image_loader=None, manifest=None, quarantined=None, **loader_options):
+    """
+    Build train/val DataLoaders reusing the same logic as script.py.
+    `image_loader` overrides the image decoder (see image_decode.make_loader),
+    `manifest` (a DatasetManifest) avoids rescanning the dataset per trial,
+    `quarantined` files (from integrity_check) are excluded and
+    `loader_options` are extra DataLoader kwargs (e.g. from loader_tuner).
+    """
     data_transforms = {
         'train': transforms.Compose([
             transforms.Resize(256),
@@ -89,29 +109,29 @@ def build_dataloaders(data_dir, batch_size, num_workers):
             return Subset(dataset, random.sample(list(range(length)), num_samples))
 
     if os.path.isdir(train_dir):
-        train_dataset = datasets.ImageFolder(train_dir, data_transforms['train'])
+        train_dataset = open_image_folder(train_dir, data_transforms['train'], image_loader, manifest, quarantined)
         class_names = train_dataset.classes
         train_dataset = apply_subset(train_dataset, len(class_names))
         
-        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, num_workers=num_workers, **loader_options, **train_sampling(train_dataset))
         dataset_sizes['train'] = len(train_dataset)
 
         if os.path.isdir(val_dir):
-            val_dataset = datasets.ImageFolder(val_dir, data_transforms['val'])
+            val_dataset = open_image_folder(val_dir, data_transforms['val'], image_loader, manifest, quarantined)
             val_dataset = apply_subset(val_dataset, len(class_names))
-            dataloaders['val'] = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+            dataloaders['val'] = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, **loader_options)
             dataset_sizes['val'] = len(val_dataset)
         else:
             dataloaders['val'] = None
             dataset_sizes['val'] = 0
     else:
         # Flat dataset — auto-split
-        if not any(os.path.isdir(os.path.join(data_dir, i)) for i in os.listdir(data_dir)):
+        if not is_packed_dataset(data_dir) and not any(os.path.isdir(os.path.join(data_dir, i)) for i in os.listdir(data_dir)):
             return None, None, None, "Invalid dataset structure."
 
         from sklearn.model_selection import train_test_split
 
-        dummy_dataset = datasets.ImageFolder(data_dir)
+        dummy_dataset = open_image_folder(data_dir, manifest=manifest, exclude=quarantined)
         class_names = dummy_dataset.classes
         total = len(dummy_dataset)
         if total == 0:
@@ -133,8 +153,8 @@ def build_dataloaders(data_dir, batch_size, num_workers):
             train_idx = subset_train.indices
             val_idx = subset_val.indices
 
-        base_dataset_train = datasets.ImageFolder(data_dir, data_transforms['train'])
-        base_dataset_val = datasets.ImageFolder(data_dir, data_transforms['val'])
+        base_dataset_train = open_image_folder(data_dir, data_transforms['train'], image_loader, manifest, quarantined)
+        base_dataset_val = open_image_folder(data_dir, data_transforms['val'], image_loader, manifest, quarantined)
 
         dataset_train = Subset(base_dataset_train, train_idx)
         dataset_val = Subset(base_dataset_val, val_idx)
@@ -142,17 +162,25 @@ def build_dataloaders(data_dir, batch_size, num_workers):
         dataset_train = apply_subset(dataset_train, len(class_names))
         dataset_val = apply_subset(dataset_val, len(class_names))
 
-        dataloaders['train'] = DataLoader(dataset_train, batch_size=batch_size, shuffle=True, num_workers=num_workers)
-        dataloaders['val'] = DataLoader(dataset_val, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+        dataloaders['train'] = DataLoader(dataset_train, batch_size=batch_size, num_workers=num_workers, **loader_options, **train_sampling(dataset_train))
+        dataloaders['val'] = DataLoader(dataset_val, batch_size=batch_size, shuffle=False, num_workers=num_workers, **loader_options)
         dataset_sizes['train'] = len(dataset_train)
         dataset_sizes['val'] = len(dataset_val)
 
     return dataloaders, dataset_sizes, class_names, None
 
 
-def run_trial_training(model, dataloaders, dataset_sizes, device, optimizer, criterion, epochs, trial_number):
-    """Run a short training and return best validation accuracy."""
+def run_trial_training(model, dataloaders, dataset_sizes, device, optimizer, criterion, epochs, trial_number,
+                       precision='fp32', channels_last=False, step_timers=None):
+    """
+    Run a short training and return (best validation accuracy, mean training
+    images/sec). The model must already be in the `channels_last` layout
+    (see precision.prepare_model). First-epoch step times are recorded into
+    `step_timers` (per phase compile_cache.StepTimer) when given.
+    """
     best_acc = 0.0
+    train_images = 0
+    train_seconds = 0.0
 
     for epoch in range(epochs):
         emit({"status": "automl_info", "message": f"Trial {trial_number} | Epoch {epoch+1}/{epochs} starting..."})
@@ -165,35 +193,42 @@ def run_trial_training(model, dataloaders, dataset_sizes, device, optimizer, cri
             else:
                 model.eval()
 
-            running_loss = 0.0
-            running_corrects = 0
+            phase_metrics = EpochMetrics()
+            phase_start = time.time()
             
             # For tracking batch progress
             total_batches = len(dataloaders[phase])
             for batch_idx, (inputs, labels) in enumerate(dataloaders[phase]):
                 if batch_idx % max(1, total_batches // 5) == 0 and batch_idx > 0:
                     emit({"status": "automl_info", "message": f"Trial {trial_number} | Epoch {epoch+1}/{epochs} | {phase.capitalize()} Batch {batch_idx}/{total_batches}"})
-                inputs = inputs.to(device)
+                inputs = prepare_inputs(inputs.to(device), channels_last)
                 labels = labels.to(device)
+                step_start = time.time()
 
                 optimizer.zero_grad()
                 with torch.set_grad_enabled(phase == 'train'):
-                    outputs = model(inputs)
-                    _, preds = torch.max(outputs, 1)
-                    loss = criterion(outputs, labels)
+                    with autocast(device, precision):
+                        outputs = model(inputs)
+                        loss = criterion(outputs, labels)
                     if phase == 'train':
                         loss.backward()
                         optimizer.step()
 
-                running_loss += loss.item() * inputs.size(0)
-                running_corrects += torch.sum(preds == labels.data)
+                phase_metrics.update(loss, outputs, labels)
+                if step_timers is not None and epoch == 0:
+                    if device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    step_timers[phase].record(time.time() - step_start, tuple(inputs.shape))
 
+            if phase == 'train':
+                train_images += dataset_sizes[phase]
+                train_seconds += time.time() - phase_start
             if phase == 'val':
-                epoch_acc = running_corrects.double() / dataset_sizes[phase]
-                best_acc = max(best_acc, epoch_acc.item())
-                emit({"status": "automl_info", "message": f"Trial {trial_number} | Epoch {epoch+1}/{epochs} Validation Accuracy: {(epoch_acc.item()*100):.2f}%"})
+                epoch_acc = phase_metrics.compute()["accuracy"]
+                best_acc = max(best_acc, epoch_acc)
+                emit({"status": "automl_info", "message": f"Trial {trial_number} | Epoch {epoch+1}/{epochs} Validation Accuracy: {(epoch_acc*100):.2f}%"})
 
-    return best_acc
+    return best_acc, train_images / max(train_seconds, 1e-9)
 
 
 def main():
@@ -206,7 +241,19 @@ def main():
     parser.add_argument('--n_trials', type=int, default=10, help='Number of Optuna trials')
     parser.add_argument('--epochs_per_trial', type=int, default=3, help='Epochs per trial')
     parser.add_argument('--num_workers', type=int, default=-1, help='DataLoader workers (-1=auto)')
+    parser.add_argument('--decode_backend', type=str, default='pil', choices=DECODE_BACKENDS, help='Image decoder: pil or draft (reduced-scale JPEG decode)')
+    parser.add_argument('--autotune_loader', action='store_true', help='Benchmark DataLoader configurations once and use the fastest for every trial')
+    parser.add_argument('--cpu_plan', type=str, default='off', choices=CPU_PLANS, help='Split CPU cores between PyTorch threads and loader workers: off, auto, or numa (pinned to one NUMA node)')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS, help='Numeric precision: fp32 or bf16 (autocast)')
+    parser.add_argument('--channels_last', action='store_true', help='Use the channels_last memory format for models and inputs')
+    parser.add_argument('--monitor_interval', type=float, default=0, help='Emit CPU/RAM/disk/loader-worker telemetry every N seconds during the sweep (0 = off)')
+    parser.add_argument('--profile_imports', action='store_true', help='Report the import time of each module loaded at startup')
+    parser.add_argument('--model_cache', action='store_true', help='Also keep the built model on disk for later sweeps and runs (trials always share one in-memory copy)')
+    parser.add_argument('--compile', action='store_true', help='Compile each trial model with torch.compile (compiled kernels are cached on disk and shared between trials)')
     args = parser.parse_args()
+    if args.profile_imports:
+        import import_profiler
+        emit(import_profiler.report())
 
     if not os.path.exists(args.path):
         emit({"status": "error", "message": "Dataset directory not found."})
@@ -215,6 +262,8 @@ def main():
     # Resolve num_workers
     if args.num_workers >= 0:
         num_workers = args.num_workers
+    elif args.cpu_plan != 'off':
+        num_workers = default_loader_workers(len(available_cpus()))
     else:
         if sys.platform == 'win32':
             num_workers = 0  # Avoid Windows multiprocessing issues
@@ -226,23 +275,55 @@ def main():
 
     emit({"status": "automl_started", "n_trials": args.n_trials, "device": str(device)})
 
-    # Import model factory (same directory)
-    import model_factory
+    # Samples until the process exits
+    from resource_monitor import start_monitor
+    start_monitor(args.monitor_interval, source='automl')
+
+    # Trials build models through the in-process cache (model_factory underneath)
+    import model_cache
+    model_cache_dir = os.path.join(os.path.expanduser("~"), ".epoq_runs", "model_cache") if args.model_cache else None
 
     # We need to know the number of classes before creating trials
     # Quick peek at the dataset
     data_dir = args.path
+    manifest = load_manifest(data_dir)
+    from integrity_check import load_quarantine
+    quarantined = load_quarantine(data_dir)
+    if quarantined:
+        emit({"status": "automl_info", "message": f"Excluding {len(quarantined)} quarantined image(s)."})
     train_dir = os.path.join(data_dir, 'train')
     if os.path.isdir(train_dir):
-        dummy = datasets.ImageFolder(train_dir)
+        dummy = open_image_folder(train_dir, manifest=manifest, exclude=quarantined)
     else:
-        dummy = datasets.ImageFolder(data_dir)
+        dummy = open_image_folder(data_dir, manifest=manifest, exclude=quarantined)
     num_classes = len(dummy.classes)
     class_names = dummy.classes
 
     emit({"status": "automl_info", "message": f"Detected {num_classes} classes: {class_names}", "num_classes": num_classes})
 
+    # Sweep transforms resize to 256 before the center crop
+    image_loader = make_loader(args.decode_backend, 256)
+
+    loader_options = {}
+    if args.autotune_loader:
+        import loader_tuner
+        probe_loaders, _, _, err = build_dataloaders(data_dir, 32, 0, image_loader, manifest, quarantined)
+        if not err and probe_loaders.get('train') is not None:
+            emit({"status": "automl_info", "message": "Autotuning data loader configuration..."})
+            runs_dir = os.path.join(os.path.expanduser("~"), ".epoq_runs")
+            loader_options = dict(loader_tuner.autotune(probe_loaders['train'].dataset, 32, runs_dir))
+            num_workers = loader_options.pop('num_workers')
+
+    if args.cpu_plan != 'off':
+        cpu_plan = make_plan(args.cpu_plan, num_workers)
+        apply_plan(cpu_plan)
+        if cpu_plan.worker_init_fn is not None and num_workers > 0:
+            loader_options['worker_init_fn'] = cpu_plan.worker_init_fn
+        emit(cpu_plan.report())
+
     trial_results = []
+    # The fp32 baseline is benchmarked once, in the first trial
+    precision_state = {"mode": args.precision, "channels_last": args.channels_last, "report": None, "checked": False}
 
     def objective(trial):
         # Suggest hyperparameters
@@ -252,13 +333,13 @@ def main():
 
         try:
             # Build dataloaders with this batch size
-            dataloaders, dataset_sizes, _, err = build_dataloaders(data_dir, batch_size, num_workers)
+            dataloaders, dataset_sizes, _, err = build_dataloaders(data_dir, batch_size, num_workers, image_loader, manifest, quarantined, **loader_options)
             if err:
                 emit({"status": "automl_trial_error", "trial": trial.number + 1, "n_trials": args.n_trials, "message": err})
                 return 0.0
 
-            # Create a fresh model for each trial
-            model, params_to_optimize = model_factory.create_model(args.model, num_classes, device)
+            # Each trial gets a copy of the built model with a fresh head
+            model, params_to_optimize = model_cache.create_model(args.model, num_classes, device, model_cache_dir)
 
             # Create optimizer
             if optimizer_name == "SGD":
@@ -270,9 +351,40 @@ def main():
 
             criterion = nn.CrossEntropyLoss()
 
-            val_acc = run_trial_training(
-                model, dataloaders, dataset_sizes, device, opt, criterion, args.epochs_per_trial, trial.number + 1
+            if (args.precision != 'fp32' or args.channels_last) and not precision_state["checked"]:
+                precision_state["checked"] = True
+                from precision import benchmark
+                try:
+                    sample_inputs, sample_labels = next(iter(dataloaders['train']))
+                    report = benchmark(model, criterion, sample_inputs.to(device), sample_labels.to(device),
+                                       device, args.precision, args.channels_last)
+                    precision_state["report"] = report
+                    emit({"status": "automl_precision_benchmark", **report})
+                except Exception as e:
+                    emit({"status": "automl_info", "message": f"{args.precision}/channels_last={args.channels_last} not supported ({e}). Using fp32."})
+                    precision_state["mode"], precision_state["channels_last"] = 'fp32', False
+            prepare_model(model, precision_state["channels_last"])
+
+            net = model
+            step_timers = None
+            if args.compile:
+                import compile_cache
+                compile_dir = compile_cache.compile_cache_dir(
+                    os.path.join(os.path.expanduser("~"), ".epoq_runs"), args.model, num_classes,
+                    (batch_size, 3, 224, 224), precision=precision_state["mode"],
+                    channels_last=precision_state["channels_last"], device=device.type
+                )
+                compile_warm = compile_cache.enable_compile_cache(compile_dir)
+                net = compile_cache.compile_model(model)
+                step_timers = {'train': compile_cache.StepTimer(), 'val': compile_cache.StepTimer()}
+
+            val_acc, images_per_sec = run_trial_training(
+                net, dataloaders, dataset_sizes, device, opt, criterion, args.epochs_per_trial, trial.number + 1,
+                precision_state["mode"], precision_state["channels_last"], step_timers
             )
+            if step_timers is not None:
+                report = compile_cache.compile_report(step_timers, compile_dir, compile_warm)
+                emit({**report, "status": "automl_compile_stats", "trial": trial.number + 1})
 
             trial_info = {
                 "status": "automl_trial",
@@ -283,13 +395,18 @@ def main():
                     "batch_size": batch_size,
                     "optimizer": optimizer_name
                 },
-                "val_accuracy": round(val_acc, 6)
+                "val_accuracy": round(val_acc, 6),
+                "images_per_sec": round(images_per_sec, 1)
             }
+            if precision_state["report"] is not None:
+                speedup = precision_state["report"]["speedup_vs_fp32"]
+                trial_info["speedup_vs_fp32"] = speedup
+                trial_info["images_per_sec_gained_vs_fp32"] = round(images_per_sec * (1 - 1 / speedup), 1)
             emit(trial_info)
             trial_results.append(trial_info)
 
             # Cleanup to free GPU memory
-            del model, opt, dataloaders
+            del model, net, opt, dataloaders
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
 
@@ -329,8 +446,4 @@ def main():
 
 
 if __name__ == "__main__":
-    _install_missing("optuna")
-    _install_missing("torch")
-    _install_missing("torchvision")
-    _install_missing("sklearn", "scikit-learn")
     main()
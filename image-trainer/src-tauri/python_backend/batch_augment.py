@@ -0,0 +1,141 @@
+# python_backend/batch_augment.py
+"""
+Batched tensor-level augmentation.
+
+In this pipeline mode DataLoader workers only decode and resize images to
+uint8 tensors (a quarter of the bytes of float32), and the augmentations
+described by the same `aug_config` used by build_transforms are applied to
+whole batches in the training process as vectorized tensor ops, followed by
+normalization.
+"""
+import math
+
+import torch
+import torch.nn.functional as F
+from torchvision import transforms
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def build_uint8_transform(image_size: int = 224):
+    """Worker-side transform: decode + resize only, returned as uint8 CHW."""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.PILToTensor(),
+    ])
+
+
+def _grayscale(x):
+    return (0.299 * x[:, 0:1] + 0.587 * x[:, 1:2] + 0.114 * x[:, 2:3])
+
+
+def _uniform(n, low, high, device):
+    return torch.empty(n, device=device).uniform_(low, high)
+
+
+class BatchAugment:
+    """
+    Applies `aug_config` augmentations and normalization to uint8 batches.
+    Every sample draws its own random parameters, as the per-image
+    torchvision transforms would.
+    """
+
+    def __init__(self, aug_config: dict, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.horizontal_flip = bool(aug_config.get("horizontalFlip"))
+        self.vertical_flip = bool(aug_config.get("verticalFlip"))
+
+        rotation_cfg = aug_config.get("rotation", {})
+        self.rotation = rotation_cfg.get("degrees", 15) if rotation_cfg.get("enabled") else None
+
+        color_cfg = aug_config.get("colorJitter", {})
+        self.color_jitter = None
+        if color_cfg.get("enabled"):
+            self.color_jitter = (
+                color_cfg.get("brightness", 0.2),
+                color_cfg.get("contrast", 0.2),
+                color_cfg.get("saturation", 0.2),
+            )
+
+        crop_cfg = aug_config.get("randomResizedCrop", {})
+        self.crop_scale = None
+        if crop_cfg.get("enabled"):
+            self.crop_scale = (crop_cfg.get("scaleMin", 0.8), crop_cfg.get("scaleMax", 1.0))
+
+        self.mean = torch.tensor(mean).view(1, 3, 1, 1)
+        self.std = torch.tensor(std).view(1, 3, 1, 1)
+
+    def __call__(self, batch, train=True):
+        x = batch.float().div_(255)
+        if train:
+            x = self._augment(x)
+        mean = self.mean.to(x.device)
+        std = self.std.to(x.device)
+        return (x - mean) / std
+
+    def _augment(self, x):
+        n, device = x.shape[0], x.device
+
+        if self.horizontal_flip:
+            flip = (torch.rand(n, device=device) < 0.5).view(-1, 1, 1, 1)
+            x = torch.where(flip, x.flip(-1), x)
+        if self.vertical_flip:
+            flip = (torch.rand(n, device=device) < 0.5).view(-1, 1, 1, 1)
+            x = torch.where(flip, x.flip(-2), x)
+
+        if self.rotation is not None or self.crop_scale is not None:
+            x = self._affine(x)
+
+        if self.color_jitter is not None:
+            x = self._jitter(x)
+        return x
+
+    def _affine(self, x):
+        """Rotation followed by random resized crop, as a single resampling pass."""
+        n, device = x.shape[0], x.device
+        theta = torch.eye(3, device=device).repeat(n, 1, 1)
+
+        if self.crop_scale is not None:
+            # Same sampling as RandomResizedCrop: area fraction and log-uniform aspect ratio
+            area = _uniform(n, *self.crop_scale, device)
+            log_ratio = _uniform(n, math.log(3 / 4), math.log(4 / 3), device)
+            ratio = torch.exp(log_ratio)
+            w = torch.sqrt(area * ratio).clamp(max=1.0)
+            h = torch.sqrt(area / ratio).clamp(max=1.0)
+            cx = (torch.rand(n, device=device) * 2 - 1) * (1 - w)
+            cy = (torch.rand(n, device=device) * 2 - 1) * (1 - h)
+            crop = torch.zeros(n, 3, 3, device=device)
+            crop[:, 0, 0], crop[:, 0, 2] = w, cx
+            crop[:, 1, 1], crop[:, 1, 2] = h, cy
+            crop[:, 2, 2] = 1
+            theta = crop
+
+        if self.rotation is not None:
+            angle = _uniform(n, -self.rotation, self.rotation, device) * math.pi / 180
+            rot = torch.zeros(n, 3, 3, device=device)
+            rot[:, 0, 0], rot[:, 0, 1] = torch.cos(angle), -torch.sin(angle)
+            rot[:, 1, 0], rot[:, 1, 1] = torch.sin(angle), torch.cos(angle)
+            rot[:, 2, 2] = 1
+            # Output coords -> crop window -> rotated source image
+            theta = rot @ theta
+
+        grid = F.affine_grid(theta[:, :2], list(x.shape), align_corners=False)
+        # Zero padding matches RandomRotation's default black fill
+        return F.grid_sample(x, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    def _jitter(self, x):
+        n, device = x.shape[0], x.device
+        brightness, contrast, saturation = self.color_jitter
+
+        if brightness:
+            factor = _uniform(n, max(0.0, 1 - brightness), 1 + brightness, device).view(-1, 1, 1, 1)
+            x = (x * factor).clamp_(0, 1)
+        if contrast:
+            factor = _uniform(n, max(0.0, 1 - contrast), 1 + contrast, device).view(-1, 1, 1, 1)
+            mean = _grayscale(x).mean(dim=(1, 2, 3), keepdim=True)
+            x = ((x - mean) * factor + mean).clamp_(0, 1)
+        if saturation:
+            factor = _uniform(n, max(0.0, 1 - saturation), 1 + saturation, device).view(-1, 1, 1, 1)
+            gray = _grayscale(x)
+            x = ((x - gray) * factor + gray).clamp_(0, 1)
+        return x
@@ -0,0 +1,95 @@
+"""
+Checkpoint formats.
+
+  full   The complete model state_dict (best_model.pth is a plain state_dict,
+         checkpoint.pth adds epoch, optimizer state and best accuracy).
+  delta  Only what training can change: the trainable parameters (the
+         classifier head, plus the DeformableBlocks for dcn) and all buffers
+         (BatchNorm running statistics keep updating in frozen backbones),
+         tagged with the pretrained backbone identity from
+         model_factory.create_model. Frozen weights are restored by
+         creating the same model again.
+
+load_checkpoint reads all of these, memory-mapping the file so only the
+tensors that are actually copied into the model are read from disk.
+"""
+import torch
+
+CHECKPOINT_FORMATS = ('full', 'delta')
+DELTA_VERSION = 1
+
+
+def _delta_state(model):
+    trainable = {name for name, p in model.named_parameters() if p.requires_grad}
+    buffers = {name for name, _ in model.named_buffers()}
+    return {k: v for k, v in model.state_dict().items() if k in trainable or k in buffers}
+
+
+def model_payload(model, checkpoint_format):
+    """Contents of best_model.pth."""
+    if checkpoint_format == 'delta':
+        return {
+            'format': 'delta',
+            'version': DELTA_VERSION,
+            'backbone': getattr(model, 'backbone_identity', None),
+            'model_state_dict': _delta_state(model),
+        }
+    return model.state_dict()
+
+
+def training_payload(model, optimizer, epoch, best_acc, checkpoint_format):
+    """Contents of a resumable training checkpoint."""
+    if checkpoint_format == 'delta':
+        payload = model_payload(model, 'delta')
+    else:
+        payload = {'model_state_dict': model.state_dict()}
+    payload.update({
+        'epoch': epoch,
+        'optimizer_state_dict': optimizer.state_dict(),
+        'best_acc': float(best_acc),
+    })
+    return payload
+
+
+def _load(path, device):
+    try:
+        return torch.load(path, map_location=device, mmap=True)
+    except RuntimeError:
+        # Legacy (non-zip) serialization cannot be memory-mapped
+        return torch.load(path, map_location=device)
+
+
+def load_checkpoint(path, model, device, optimizer=None):
+    """
+    Loads any checkpoint written by script.py into `model` (and `optimizer`
+    when the file has optimizer state). Returns (epoch, best_acc), both None
+    for weights-only files. Raises ValueError if a delta checkpoint was made
+    on a different backbone.
+    """
+    checkpoint = _load(path, device)
+    if not (isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint):
+        model.load_state_dict(checkpoint)
+        return None, None
+
+    if checkpoint.get('format') == 'delta':
+        expected = getattr(model, 'backbone_identity', None)
+        if checkpoint.get('backbone') != expected:
+            raise ValueError(
+                f"Checkpoint was trained on backbone {checkpoint.get('backbone')}, "
+                f"but the current model is {expected}."
+            )
+        result = model.load_state_dict(checkpoint['model_state_dict'], strict=False)
+        if result.unexpected_keys:
+            raise ValueError(f"Unexpected keys in delta checkpoint: {result.unexpected_keys[:5]}")
+        frozen = {name for name, p in model.named_parameters() if not p.requires_grad}
+        missing = [k for k in result.missing_keys if k not in frozen]
+        if missing:
+            raise ValueError(f"Delta checkpoint is missing trainable weights: {missing[:5]}")
+    else:
+        model.load_state_dict(checkpoint['model_state_dict'])
+
+    if optimizer is not None and 'optimizer_state_dict' in checkpoint:
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+    if 'epoch' not in checkpoint:
+        return None, None
+    return checkpoint['epoch'], checkpoint.get('best_acc', 0.0)
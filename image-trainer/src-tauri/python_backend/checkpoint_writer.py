@@ -0,0 +1,162 @@
+"""
+Background checkpoint writer.
+
+State is snapshotted to CPU memory on the training thread (a copy is
+required because training keeps updating the tensors in place) and
+serialized by a writer thread, so the loop does not wait on disk I/O.
+Every file is written to a temp name and atomically renamed over the
+target, so a crash mid-write leaves the previous file intact.
+
+Rotating checkpoints are kept in <save_dir>/checkpoints as
+checkpoint_e0001.pth, checkpoint_e0002.pth, ... (the N most recently written
+are retained; runs share the directory, so recency rather than the epoch
+number decides) and <save_dir>/checkpoint.pth always refers to the newest
+complete one, for --resume.
+"""
+import os
+import re
+import queue
+import atexit
+import shutil
+import tempfile
+import threading
+
+import torch
+
+from status_output import emit
+
+_ROTATING = re.compile(r'^checkpoint_e\d+\.pth$')
+
+
+def snapshot(obj):
+    """Detached CPU copy of every tensor in a (nested) state dict."""
+    if torch.is_tensor(obj):
+        if obj.device.type == 'cpu':
+            return obj.detach().clone()
+        return obj.detach().to('cpu')
+    if isinstance(obj, dict):
+        return type(obj)((k, snapshot(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def _temp_path(path):
+    """A fresh, unique temp file name next to `path` (concurrent writers never share one)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def _discard(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def atomic_save(state, path):
+    """torch.save to a temp file in the same directory, then rename over `path`."""
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def _link_latest(source, link_path):
+    """Points `link_path` at `source` (hard link where supported, copy otherwise), atomically."""
+    tmp_path = _temp_path(link_path)
+    try:
+        # os.link needs a free name: reuse the unique one mkstemp reserved
+        os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, link_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+class CheckpointWriter:
+    """
+    Single writer thread with a small bounded queue: if disk falls behind by
+    more than `max_pending` snapshots, save() waits instead of piling up
+    CPU copies of large state dicts.
+    """
+
+    def __init__(self, save_dir, keep_last=3, max_pending=2):
+        self.save_dir = save_dir
+        self.rotating_dir = os.path.join(save_dir, 'checkpoints')
+        self.keep_last = max(1, keep_last)
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    # ---------- training thread ----------
+
+    def save(self, state, path):
+        """Queues a snapshot of `state` to be written atomically to `path`."""
+        self._queue.put(('file', snapshot(state), path))
+
+    def save_rotating(self, state, epoch):
+        """Queues checkpoint_e{epoch}.pth, updates checkpoint.pth and prunes old epochs."""
+        self._queue.put(('rotating', snapshot(state), epoch))
+
+    def flush(self):
+        """Blocks until every queued checkpoint is on disk."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    # ---------- writer thread ----------
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                kind, state, target = job
+                if kind == 'file':
+                    atomic_save(state, target)
+                else:
+                    self._write_rotating(state, target)
+            except Exception as e:
+                self.error = e
+                emit({"status": "warning", "message": f"Checkpoint write failed: {e}"})
+            finally:
+                self._queue.task_done()
+
+    def _write_rotating(self, state, epoch):
+        os.makedirs(self.rotating_dir, exist_ok=True)
+        path = os.path.join(self.rotating_dir, f'checkpoint_e{epoch + 1:04d}.pth')
+        atomic_save(state, path)
+        _link_latest(path, os.path.join(self.save_dir, 'checkpoint.pth'))
+
+        rotating = sorted(
+            (entry.stat().st_mtime_ns, entry.path)
+            for entry in os.scandir(self.rotating_dir)
+            if _ROTATING.match(entry.name)
+        )
+        for _, old_path in rotating[:-self.keep_last]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
@@ -0,0 +1,97 @@
+"""
+torch.compile support with a persistent on-disk compile cache.
+
+Inductor's FX graph cache (and the AOTAutograd cache where available) is
+pointed at ~/.epoq_runs/compile_cache/<key>, where the key covers the
+architecture, class count and input shape plus the settings that change
+the traced graph. A later run or sweep trial with the same key loads the
+compiled kernels instead of generating them again; Dynamo still traces
+the model, so a warm start is faster but not free.
+"""
+import os
+import json
+import hashlib
+
+import torch
+
+
+def compile_cache_dir(save_dir, model_name, num_classes, input_shape, **extra):
+    key = json.dumps({
+        "model": model_name,
+        "num_classes": num_classes,
+        "input_shape": list(input_shape),
+        "torch": torch.__version__,
+        **extra,
+    }, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(save_dir, 'compile_cache', f"{model_name}-{digest}")
+
+
+def enable_compile_cache(cache_dir):
+    """Points Inductor's caches at `cache_dir`. Returns True if it already holds artifacts."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with os.scandir(cache_dir) as it:
+        warm = any(it)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] = "1"
+    os.environ["TORCHINDUCTOR_AUTOGRAD_CACHE"] = "1"
+
+    import torch._inductor.config as inductor_config
+    inductor_config.fx_graph_cache = True
+    try:
+        import torch._functorch.config as functorch_config
+        functorch_config.enable_autograd_cache = True
+    except (ImportError, AttributeError):
+        pass
+    return warm
+
+
+def compile_model(net):
+    """
+    Compiles the module; parameters are shared, so optimizers and
+    state_dicts are unaffected. Shapes are static: an epoch has at most two
+    batch shapes (full and last), and specialized graphs cache cleanly.
+    """
+    return torch.compile(net, dynamic=False)
+
+
+class StepTimer:
+    """
+    Splits the step times of one phase into compiling steps (the first step
+    with each new input shape) and steady-state steps.
+    """
+
+    def __init__(self):
+        self.shapes = set()
+        self.compile_total = 0.0
+        self.steady_total = 0.0
+        self.steady_steps = 0
+
+    def record(self, seconds, shape):
+        if shape not in self.shapes:
+            self.shapes.add(shape)
+            self.compile_total += seconds
+        else:
+            self.steady_total += seconds
+            self.steady_steps += 1
+
+    @property
+    def steady(self):
+        return self.steady_total / self.steady_steps if self.steady_steps else None
+
+    def compile_seconds(self):
+        """Time the compiling steps spent beyond steady-state steps."""
+        return max(self.compile_total - len(self.shapes) * (self.steady or 0.0), 0.0)
+
+
+def compile_report(timers, cache_dir, warm):
+    """compile_stats event from the per-phase timers of the first epoch."""
+    train = timers.get('train')
+    steady = train.steady if train is not None else None
+    return {
+        "status": "compile_stats",
+        "compile_seconds": round(sum(t.compile_seconds() for t in timers.values()), 2),
+        "steady_step_ms": round(steady * 1000, 2) if steady is not None else None,
+        "cache_warm": warm,
+        "cache_dir": cache_dir,
+    }
@@ -6,16 +6,26 @@ import json
 import os
 import argparse
 from pathlib import Path
-from PIL import Image
 from collections import Counter
 
+from dataset_manifest import DatasetManifest
+from image_decode import DECODE_BACKENDS
+from integrity_check import load_quarantine, verify_dataset
 
-def analyze_dataset(dataset_path):
+# Extensions the analyzer has always counted
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def analyze_dataset(dataset_path, decode_backend='pil', verify=False):
     """
     Analyzes an image dataset and returns statistics.
     
     Args:
         dataset_path: Path to the dataset directory
+        decode_backend: If not 'pil', also estimate the per-epoch decode time
+            that backend saves (see image_decode.py)
+        verify: Fully decode every image and update the quarantine list
+            (see integrity_check.py)
         
     Returns:
         Dictionary containing dataset statistics
@@ -65,59 +75,35 @@ def analyze_dataset(dataset_path):
     all_classes = set()
     total_images = 0
     sizes = []
+    sample_paths = []
+    unreadable = 0
+    
+    # Every listing and image size below comes from the shared manifest
+    manifest = DatasetManifest.load(dataset_path, restat=verify)
     
     for split_name, split_path in splits.items():
         split_count = 0
-        split_sizes = {}
         
-        if split_name:
-            # This is a split directory (train/val/test)
-            if os.path.isdir(split_path):
-                for class_name in sorted(os.listdir(split_path)):
-                    class_path = os.path.join(split_path, class_name)
-                    if os.path.isdir(class_path):
-                        all_classes.add(class_name)
-                        class_images = [f for f in os.listdir(class_path) 
-                                       if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-                        class_count = len(class_images)
-                        split_count += class_count
-                        total_images += class_count
-                        
-                        # Count sizes for this class
-                        for img_file in class_images[:10]:  # Sample first 10 for size info
-                            try:
-                                img_path = os.path.join(class_path, img_file)
-                                with Image.open(img_path) as img:
-                                    size = img.size
-                                    size_key = f"{size[0]}x{size[1]}"
-                                    split_sizes[size_key] = split_sizes.get(size_key, 0) + 1
-                                    sizes.append(size)
-                            except:
-                                pass
-        else:
-            # No split - check for class folders in root
-            if os.path.isdir(split_path):
-                for class_name in sorted(os.listdir(split_path)):
-                    class_path = os.path.join(split_path, class_name)
-                    if os.path.isdir(class_path):
-                        all_classes.add(class_name)
-                        class_images = [f for f in os.listdir(class_path) 
-                                       if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-                        class_count = len(class_images)
-                        split_count += class_count
-                        total_images += class_count
-                        
-                        # Count sizes for this class
-                        for img_file in class_images[:10]:
-                            try:
-                                img_path = os.path.join(class_path, img_file)
-                                with Image.open(img_path) as img:
-                                    size = img.size
-                                    size_key = f"{size[0]}x{size[1]}"
-                                    split_sizes[size_key] = split_sizes.get(size_key, 0) + 1
-                                    sizes.append(size)
-                            except:
-                                pass
+        for class_name in manifest.subdirs(split_path):
+            class_path = os.path.join(split_path, class_name)
+            all_classes.add(class_name)
+            class_images = manifest.files(class_path, IMAGE_EXTENSIONS)
+            class_count = len(class_images)
+            split_count += class_count
+            total_images += class_count
+            
+            key = f"{split_name}/{class_name}" if split_name else class_name
+            result["class_counts"][key] = class_count
+            
+            sample_paths.extend(os.path.join(class_path, f) for f in class_images[:4])
+            
+            # Dimensions were recorded for every image when the manifest was built
+            for img_file in class_images:
+                _, _, width, height = manifest.file_info(os.path.join(class_path, img_file))
+                if width is not None:
+                    sizes.append((width, height))
+                else:
+                    unreadable += 1
         
         result["splits"][split_name if split_name else "root"] = split_count
         
@@ -128,16 +114,11 @@ def analyze_dataset(dataset_path):
     result["classes"] = sorted(list(all_classes))
     result["class_count"] = len(all_classes)
     
-    # Re-analyze to get class counts per split
-    for split_name, split_path in splits.items():
-        if os.path.isdir(split_path):
-            for class_name in os.listdir(split_path):
-                class_path = os.path.join(split_path, class_name)
-                if os.path.isdir(class_path):
-                    class_images = [f for f in os.listdir(class_path) 
-                                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-                    key = f"{split_name}/{class_name}" if split_name else class_name
-                    result["class_counts"][key] = len(class_images)
+    # Images whose header could not be read, and files quarantined by a full verification
+    if verify:
+        result["integrity"] = verify_dataset(dataset_path, manifest, progress=False)
+    result["unreadable_images"] = unreadable
+    result["quarantined_images"] = len(load_quarantine(dataset_path))
     
     # Calculate average image size
     if sizes:
@@ -153,15 +134,29 @@ def analyze_dataset(dataset_path):
             for s, c in size_counter.most_common(5)
         ]
     
+    # Estimate decode savings of a faster backend on a small sample
+    if decode_backend != 'pil' and sample_paths:
+        from image_decode import estimate_epoch_savings, make_loader
+        blobs = []
+        for img_path in sample_paths[:32]:
+            with open(img_path, 'rb') as f:
+                blobs.append(f.read())
+        result["decode_benchmark"] = {
+            "backend": decode_backend,
+            **estimate_epoch_savings(blobs, make_loader(decode_backend, 224), result["train_count"] or total_images)
+        }
+    
     return result
 
 
 def main():
     parser = argparse.ArgumentParser(description='Dataset Analyzer')
     parser.add_argument('--path', type=str, required=True, help='Path to dataset')
+    parser.add_argument('--decode_backend', type=str, default='pil', choices=DECODE_BACKENDS, help='Also estimate decode savings for this backend (e.g. draft)')
+    parser.add_argument('--verify', action='store_true', help='Fully decode every image and quarantine unreadable ones')
     args = parser.parse_args()
     
-    result = analyze_dataset(args.path)
+    result = analyze_dataset(args.path, args.decode_backend, args.verify)
     print(json.dumps(result), flush=True)
 
 
@@ -0,0 +1,248 @@
+"""
+Persistent dataset manifest shared by the trainer, the AutoML sweep and the
+dataset analyzer.
+
+The manifest is a snapshot of the dataset tree: for every directory its
+mtime, subdirectories and image files (size, mtime, width, height). It is
+stored under ~/.epoq_runs/manifests and refreshed incrementally: a directory
+whose mtime is unchanged is reused without listing it, and files whose size
+and mtime are unchanged keep their recorded dimensions. Adding, removing or
+renaming files updates the parent directory's mtime, so file lists stay
+exact. A file rewritten in place leaves the directory mtime alone and keeps
+its recorded size/dimensions; a refresh with `restat` (or a full rescan)
+stats the files of reused directories and re-probes the changed ones.
+Consumers that need exact file stamps (integrity check, cache
+fingerprints) stat the files themselves.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+MANIFEST_VERSION = 1
+
+# torchvision's IMG_EXTENSIONS plus .gif, which the analyzer also counts
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp', '.gif')
+
+
+def default_manifest_dir():
+    return os.path.join(os.path.expanduser("~"), ".epoq_runs", "manifests")
+
+
+def keep_class_dir(name):
+    """Class folder filter shared with FilteredImageFolder (skip hidden and experiments)."""
+    return not name.startswith(".") and name.lower() != "experiments"
+
+
+def _read_dimensions(path):
+    try:
+        with Image.open(path) as img:  # reads the header only
+            return list(img.size)
+    except Exception:
+        return [None, None]
+
+
+class DatasetManifest:
+    def __init__(self, root, dirs=None):
+        self.root = os.path.abspath(root)
+        # relative dir path ('' for root) -> {"mtime_ns", "subdirs", "files": {name: [size, mtime_ns, w, h]}}
+        self.dirs = dirs or {}
+        self.last_refresh = None
+
+    # ---------- persistence ----------
+
+    @staticmethod
+    def path_for(root, manifest_dir=None):
+        digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+        return os.path.join(manifest_dir or default_manifest_dir(), f"{digest}.json")
+
+    @classmethod
+    def load(cls, root, manifest_dir=None, rescan=False, restat=False):
+        """
+        Loads the stored manifest for `root`, refreshes it (see refresh for
+        `restat`) and saves it if anything changed.
+        """
+        path = cls.path_for(root, manifest_dir)
+        manifest = cls(root)
+        if not rescan:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION and data.get("root") == manifest.root:
+                    manifest.dirs = data["dirs"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+        stats = manifest.last_refresh = manifest.refresh(full=rescan, restat=restat)
+        if stats["changed_dirs"] or stats["changed_files"] or not os.path.exists(path):
+            manifest.save(path)
+        return manifest
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A private temp file per writer: ranks, sweeps and daemon threads may save concurrently
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"version": MANIFEST_VERSION, "root": self.root, "dirs": self.dirs}, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    # ---------- refresh ----------
+
+    def refresh(self, full=False, restat=False):
+        """
+        Brings the manifest up to date with the filesystem. Only directories
+        whose mtime changed are listed again (all of them if `full`); with
+        `restat`, the files of the others are stat'ed to catch in-place
+        rewrites. Returns counts of changed directories, files rewritten in
+        place and newly probed files.
+        """
+        start = time.time()
+        old_dirs = self.dirs
+        new_dirs = {}
+        to_probe = []
+        changed = 0
+        changed_files = 0
+
+        pending = ['']
+        while pending:
+            rel = pending.pop()
+            abs_dir = os.path.join(self.root, rel)
+            try:
+                mtime_ns = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+
+            old = old_dirs.get(rel)
+            if old is not None and old["mtime_ns"] == mtime_ns and not full:
+                node = old
+                if restat:
+                    changed_files += self._restat_files(abs_dir, node, to_probe)
+            else:
+                changed += 1
+                node = self._scan_dir(abs_dir, mtime_ns, old, to_probe)
+            new_dirs[rel] = node
+            pending.extend(os.path.join(rel, d) if rel else d for d in node["subdirs"])
+
+        # Header reads are I/O bound, so new files are probed from a thread pool
+        if to_probe:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                dims = pool.map(_read_dimensions, [path for _, _, path in to_probe])
+                for (files, name, _), size in zip(to_probe, dims):
+                    files[name][2:4] = size
+
+        removed = len(set(old_dirs) - set(new_dirs))
+        self.dirs = new_dirs
+        return {
+            "changed_dirs": changed + removed,
+            "changed_files": changed_files,
+            "probed_files": len(to_probe),
+            "seconds": round(time.time() - start, 3),
+        }
+
+    @staticmethod
+    def _restat_files(abs_dir, node, to_probe):
+        """Re-stats the files of an unlisted directory; returns how many changed in place."""
+        files = node["files"]
+        changed = 0
+        for name, info in list(files.items()):
+            path = os.path.join(abs_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                del files[name]
+                changed += 1
+                continue
+            if info[0] != st.st_size or info[1] != st.st_mtime_ns:
+                files[name] = [st.st_size, st.st_mtime_ns, None, None]
+                to_probe.append((files, name, path))
+                changed += 1
+        return changed
+
+    @staticmethod
+    def _scan_dir(abs_dir, mtime_ns, old, to_probe):
+        old_files = old["files"] if old else {}
+        subdirs = []
+        files = {}
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=True):
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    st = entry.stat()
+                    prev = old_files.get(entry.name)
+                    if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+                        files[entry.name] = prev
+                    else:
+                        files[entry.name] = [st.st_size, st.st_mtime_ns, None, None]
+                        to_probe.append((files, entry.name, entry.path))
+        subdirs.sort()
+        return {"mtime_ns": mtime_ns, "subdirs": subdirs, "files": files}
+
+    # ---------- queries ----------
+
+    def _rel(self, directory):
+        rel = os.path.relpath(os.path.abspath(directory), self.root)
+        return '' if rel == '.' else rel
+
+    def has_dir(self, directory):
+        return self._rel(directory) in self.dirs
+
+    def subdirs(self, directory):
+        return list(self.dirs[self._rel(directory)]["subdirs"])
+
+    def files(self, directory, extensions=IMAGE_EXTENSIONS):
+        """Sorted image file names directly inside `directory`."""
+        names = self.dirs[self._rel(directory)]["files"]
+        return sorted(n for n in names if n.lower().endswith(extensions))
+
+    def iter_files(self):
+        """Yields (absolute path, [size, mtime_ns, width, height]) for every image in the tree."""
+        for rel, node in self.dirs.items():
+            for name, info in node["files"].items():
+                yield os.path.join(self.root, rel, name), info
+
+    def file_info(self, path):
+        """(size, mtime_ns, width, height) of a file recorded in the manifest."""
+        rel = self._rel(path)
+        return tuple(self.dirs[os.path.dirname(rel)]["files"][os.path.basename(rel)])
+
+    def find_classes(self, directory):
+        """Same result as FilteredImageFolder.find_classes, without touching the disk."""
+        classes = sorted(d for d in self.subdirs(directory) if keep_class_dir(d))
+        return classes, {cls_name: i for i, cls_name in enumerate(classes)}
+
+    def make_dataset(self, directory, class_to_idx, extensions):
+        """Same (path, class_index) list as torchvision's make_dataset (sorted walk, followlinks)."""
+        instances = []
+        empty = []
+        for target_class in sorted(class_to_idx):
+            class_index = class_to_idx[target_class]
+            walk = []
+            pending = [os.path.join(directory, target_class)]
+            while pending:
+                current = pending.pop()
+                walk.append(current)
+                pending.extend(os.path.join(current, d) for d in self.subdirs(current))
+            count = 0
+            for current in sorted(walk):
+                for name in self.files(current, tuple(extensions)):
+                    instances.append((os.path.join(current, name), class_index))
+                    count += 1
+            if count == 0:
+                empty.append(target_class)
+        if empty:
+            raise FileNotFoundError(f"Found no valid file for the classes {', '.join(sorted(empty))}. "
+                                    f"Supported extensions are: {', '.join(extensions)}")
+        return instances
@@ -0,0 +1,194 @@
+"""
+Multi-process CPU data-parallel training (DistributedDataParallel over gloo).
+
+The launcher re-runs the training script once per local rank, pinning each
+rank to its own group of cores (one group per CPU socket by default) with a
+matching intra-op thread count. Several machines join through a rendezvous
+address: run the same command on every node with --nnodes, --node_rank and
+--master_addr/--master_port pointing at node 0.
+
+Inside a rank, DistributedContext provides the process-group helpers the
+trainer needs: sharded train/val loaders, metric all-reduce, and
+"rank 0 first" sections for work that writes shared caches. Only global
+rank 0 writes to stdout; the other ranks' stdout is discarded.
+"""
+import os
+import sys
+import time
+import contextlib
+import subprocess
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+
+from status_output import emit
+
+# Set by the launcher so unrelated RANK/WORLD_SIZE variables are not picked up
+WORKER_ENV = 'EPOQ_DISTRIBUTED'
+
+
+def in_worker():
+    return os.environ.get(WORKER_ENV) == '1'
+
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def socket_groups():
+    """Available CPUs grouped by physical package (socket); one group if unknown."""
+    cpus = _available_cpus()
+    groups = {}
+    for cpu in cpus:
+        path = f'/sys/devices/system/cpu/cpu{cpu}/topology/physical_package_id'
+        try:
+            with open(path) as f:
+                socket = int(f.read().strip())
+        except (OSError, ValueError):
+            socket = 0
+        groups.setdefault(socket, []).append(cpu)
+    return [groups[key] for key in sorted(groups)]
+
+
+def core_groups(nproc):
+    """
+    Splits the available CPUs into `nproc` contiguous groups, socket by
+    socket; nproc <= 0 means one group per socket.
+    """
+    sockets = socket_groups()
+    if nproc <= 0:
+        return sockets
+    cpus = [cpu for group in sockets for cpu in group]
+    nproc = min(nproc, len(cpus))
+    return [list(chunk) for chunk in np.array_split(cpus, nproc)]
+
+
+def launch(nproc, nnodes=1, node_rank=0, master_addr='127.0.0.1', master_port=29500):
+    """
+    Starts the local ranks of this node and waits for them. If any rank
+    fails, the others are terminated (they would block in collectives).
+    Returns the exit code for the launcher process.
+    """
+    groups = core_groups(nproc)
+    local_world = len(groups)
+    world_size = local_world * nnodes
+    emit({
+        "status": "distributed_launch",
+        "ranks_per_node": local_world,
+        "nodes": nnodes,
+        "world_size": world_size,
+        "cpus_per_rank": [len(group) for group in groups],
+    })
+
+    procs = []
+    for local_rank, cpus in enumerate(groups):
+        rank = node_rank * local_world + local_rank
+        env = dict(
+            os.environ,
+            RANK=str(rank),
+            WORLD_SIZE=str(world_size),
+            LOCAL_RANK=str(local_rank),
+            LOCAL_WORLD_SIZE=str(local_world),
+            MASTER_ADDR=master_addr,
+            MASTER_PORT=str(master_port),
+            OMP_NUM_THREADS=str(len(cpus)),
+            EPOQ_RANK_CPUS=','.join(str(cpu) for cpu in cpus),
+        )
+        env[WORKER_ENV] = '1'
+        stdout = None if rank == 0 else subprocess.DEVNULL
+        procs.append(subprocess.Popen([sys.executable] + sys.argv, env=env, stdout=stdout))
+
+    exit_code = 0
+    running = list(procs)
+    while running:
+        for proc in list(running):
+            code = proc.poll()
+            if code is None:
+                continue
+            running.remove(proc)
+            if code != 0 and exit_code == 0:
+                exit_code = code
+                for other in running:
+                    other.terminate()
+        time.sleep(0.2)
+    return exit_code
+
+
+class DistributedContext:
+    def __init__(self, rank, world_size, local_rank):
+        self.rank = rank
+        self.world_size = world_size
+        self.local_rank = local_rank
+
+    @property
+    def is_main(self):
+        return self.rank == 0
+
+    @contextlib.contextmanager
+    def main_first(self):
+        """Rank 0 runs the block first (e.g. to build a cache); the others run it afterwards."""
+        if not self.is_main:
+            dist.barrier()
+        try:
+            yield
+        finally:
+            # Also on error, so the waiting ranks are released rather than left blocked
+            if self.is_main:
+                dist.barrier()
+
+    def shard_train_loader(self, loader, seed=42):
+        """
+        Train loader over this rank's shard (equal batch counts on every
+        rank). Packed datasets keep shard-sequential reads: the shared shard
+        order is split across ranks instead of using DistributedSampler.
+        """
+        from image_datasets import ShardSequentialSampler
+        if isinstance(loader.sampler, ShardSequentialSampler):
+            sampler = ShardSequentialSampler(
+                loader.dataset, loader.sampler.chunk_size, num_replicas=self.world_size, rank=self.rank, seed=seed
+            )
+        else:
+            sampler = DistributedSampler(loader.dataset, num_replicas=self.world_size, rank=self.rank, shuffle=True, seed=seed)
+        return DataLoader(
+            loader.dataset, batch_size=loader.batch_size, sampler=sampler,
+            num_workers=loader.num_workers, pin_memory=loader.pin_memory,
+            prefetch_factor=loader.prefetch_factor, persistent_workers=loader.persistent_workers,
+            worker_init_fn=loader.worker_init_fn,
+        )
+
+    def shard_eval_loader(self, loader):
+        """Every world_size-th sample, without the padding DistributedSampler adds, so reduced metrics are exact."""
+        from image_datasets import loader_labels, subset_loader
+        positions = np.arange(self.rank, len(loader_labels(loader)), self.world_size)
+        return subset_loader(loader, positions)
+
+    @staticmethod
+    def set_epoch(loader, epoch):
+        sampler = getattr(loader, 'sampler', None)
+        if hasattr(sampler, 'set_epoch'):
+            sampler.set_epoch(epoch)
+
+    def shutdown(self):
+        if dist.is_initialized():
+            dist.destroy_process_group()
+
+
+def init_worker():
+    """Pins this rank to its cores, joins the gloo process group and silences stdout on ranks > 0."""
+    cpus = [int(cpu) for cpu in os.environ.get('EPOQ_RANK_CPUS', '').split(',') if cpu]
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
+
+    rank = int(os.environ['RANK'])
+    world_size = int(os.environ['WORLD_SIZE'])
+    dist.init_process_group('gloo', init_method='env://', rank=rank, world_size=world_size)
+    if rank != 0:
+        sys.stdout = open(os.devnull, 'w')
+    return DistributedContext(rank, world_size, int(os.environ.get('LOCAL_RANK', 0)))
@@ -0,0 +1,270 @@
+"""
+Deployment export for models trained by script.py.
+
+Loads a trained checkpoint (full or delta format) for a model_factory
+architecture and writes, to --output_dir (default ~/.epoq_runs/export):
+
+  model_fp32.pt       TorchScript (traced and frozen)
+  model_fp32.onnx     ONNX graph (--onnx; needs the onnx package)
+  model_int8.pt       TorchScript, post-training int8 quantized. Static
+                      quantization (FX graph mode, x86 backend) calibrated on
+                      a slice of the train split; architectures that cannot
+                      be symbolically traced fall back to dynamic int8
+                      quantization of their Linear layers.
+  export_report.json  Classes, preprocessing, latency and accuracy results
+
+The exported TorchScript files are reloaded and benchmarked on the CPU
+(p50/p99 latency at batch size 1, throughput at --batch_size) and compared
+on the test split (the val split if there is none). The int8 model passes
+the drift check if its accuracy is at most --max_accuracy_drop below fp32.
+Outputs JSON status lines to stdout for the EPOQ frontend.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+
+import numpy as np
+import torch
+from torchvision import transforms
+from torch.utils.data import DataLoader, Subset
+
+from image_datasets import open_image_folder, load_manifest, split_indices
+from checkpoint_format import load_checkpoint
+from status_output import emit
+
+IMAGE_SIZE = 224
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+
+def eval_transform(image_size=IMAGE_SIZE):
+    """The val/test preprocessing script.py trains against."""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(MEAN, STD),
+    ])
+
+
+def export_splits(data_dir, transform):
+    """(calibration dataset from train, evaluation dataset from test/val, class names)."""
+    from integrity_check import load_quarantine
+    manifest = load_manifest(data_dir)
+    quarantined = load_quarantine(data_dir)
+    train_dir = os.path.join(data_dir, 'train')
+    if os.path.isdir(train_dir):
+        train_dataset = open_image_folder(train_dir, transform, manifest=manifest, exclude=quarantined)
+        eval_dataset = None
+        for name in ('test', 'val', 'validation'):
+            split_dir = os.path.join(data_dir, name)
+            if os.path.isdir(split_dir):
+                eval_dataset = open_image_folder(split_dir, transform, manifest=manifest, exclude=quarantined)
+                break
+        return train_dataset, eval_dataset, train_dataset.classes
+
+    full = open_image_folder(data_dir, transform, manifest=manifest, exclude=quarantined)
+    train_idx, val_idx, test_idx = split_indices(full.targets)
+    return Subset(full, train_idx), Subset(full, test_idx or val_idx), full.classes
+
+
+def calibration_loader(dataset, batch_size, num_batches, num_workers, seed=42):
+    """A fixed random slice of the train split for observer calibration."""
+    count = min(len(dataset), batch_size * num_batches)
+    picked = np.random.default_rng(seed).choice(len(dataset), size=count, replace=False)
+    return DataLoader(Subset(dataset, sorted(picked.tolist())), batch_size=batch_size, num_workers=num_workers)
+
+
+def quantize_static(model, calib_loader, example):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    torch.backends.quantized.engine = 'x86'
+    prepared = prepare_fx(model, get_default_qconfig_mapping('x86'), example_inputs=(example,))
+    with torch.no_grad():
+        for inputs, _ in calib_loader:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize(model, calib_loader, example):
+    """Returns (int8 model, mode), trying static quantization first."""
+    import copy
+    try:
+        return quantize_static(copy.deepcopy(model), calib_loader, example), 'static'
+    except Exception as e:
+        emit({"status": "export_info", "message": f"Static quantization unavailable for this architecture ({type(e).__name__}: {e}); using dynamic int8."})
+        return quantize_dynamic(copy.deepcopy(model)), 'dynamic'
+
+
+def save_torchscript(model, example, path):
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example).eval())
+    torch.jit.save(scripted, path)
+    return path
+
+
+def save_onnx(model, example, path):
+    torch.onnx.export(
+        model, (example,), path, input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+    )
+    return path
+
+
+def measure_latency(model, image_size, batch_size, iters=50, warmup=5):
+    """p50/p99 single-image latency (ms) and batched throughput (images/sec)."""
+    single = torch.randn(1, 3, image_size, image_size)
+    batch = torch.randn(batch_size, 3, image_size, image_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + iters):
+            start = time.perf_counter()
+            model(single)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+        for _ in range(2):
+            model(batch)
+        batch_iters = max(3, iters // 10)
+        start = time.perf_counter()
+        for _ in range(batch_iters):
+            model(batch)
+        elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+        "images_per_sec": round(batch_iters * batch_size / elapsed, 1),
+    }
+
+
+def predict(model, loader):
+    preds, labels = [], []
+    with torch.no_grad():
+        for inputs, targets in loader:
+            preds.append(model(inputs).argmax(1))
+            labels.append(targets)
+    return torch.cat(preds), torch.cat(labels)
+
+
+def file_mb(path):
+    return round(os.path.getsize(path) / 1e6, 2)
+
+
+def main():
+    import model_factory
+    parser = argparse.ArgumentParser(description='EPOQ model export')
+    parser.add_argument('--path', type=str, required=True, help='Path to dataset (class names, calibration and test images)')
+    parser.add_argument('--model', type=str, required=True, choices=list(model_factory.get_available_models()), help='Architecture the checkpoint was trained with')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Trained checkpoint (default: ~/.epoq_runs/best_model.pth)')
+    parser.add_argument('--output_dir', type=str, default=None, help='Output directory (default: ~/.epoq_runs/export)')
+    parser.add_argument('--onnx', action='store_true', help='Also export the fp32 model as ONNX')
+    parser.add_argument('--calibration_batches', type=int, default=10, help='Train batches used to calibrate int8 activation ranges')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size for calibration, evaluation and the throughput benchmark')
+    parser.add_argument('--num_workers', type=int, default=0, help='DataLoader workers for calibration and evaluation')
+    parser.add_argument('--latency_iters', type=int, default=50, help='Timed single-image forward passes per model')
+    parser.add_argument('--max_accuracy_drop', type=float, default=0.01, help='Largest accepted test accuracy drop of the int8 model vs fp32 (absolute)')
+    args = parser.parse_args()
+
+    runs_dir = os.path.join(os.path.expanduser("~"), ".epoq_runs")
+    checkpoint = args.checkpoint or os.path.join(runs_dir, 'best_model.pth')
+    output_dir = args.output_dir or os.path.join(runs_dir, 'export')
+    if not os.path.exists(args.path):
+        emit({"status": "error", "message": "Dataset directory not found."})
+        return
+    if not os.path.exists(checkpoint):
+        emit({"status": "error", "message": f"Checkpoint not found: {checkpoint}"})
+        return
+    os.makedirs(output_dir, exist_ok=True)
+
+    transform = eval_transform()
+    train_dataset, eval_dataset, class_names = export_splits(args.path, transform)
+    emit({"status": "export_started", "model": args.model, "checkpoint": checkpoint, "num_classes": len(class_names)})
+
+    try:
+        model, _ = model_factory.create_model(args.model, len(class_names), torch.device('cpu'))
+        load_checkpoint(checkpoint, model, torch.device('cpu'))
+    except (RuntimeError, ValueError) as e:
+        emit({"status": "error", "message": f"Could not load checkpoint for {args.model}: {e}"})
+        return
+    model.eval()
+    example = torch.randn(1, 3, IMAGE_SIZE, IMAGE_SIZE)
+
+    # --- Artifacts ---
+    artifacts = {}
+    artifacts['torchscript_fp32'] = save_torchscript(model, example, os.path.join(output_dir, 'model_fp32.pt'))
+    if args.onnx:
+        if importlib.util.find_spec('onnx') is None:
+            emit({"status": "export_info", "message": "Skipping ONNX export: the onnx package is not installed."})
+        else:
+            try:
+                artifacts['onnx_fp32'] = save_onnx(model, example, os.path.join(output_dir, 'model_fp32.onnx'))
+            except Exception as e:
+                emit({"status": "export_info", "message": f"ONNX export failed: {e}"})
+
+    emit({"status": "export_info", "message": "Calibrating int8 quantization..."})
+    calib_loader = calibration_loader(train_dataset, args.batch_size, args.calibration_batches, args.num_workers)
+    int8_model, quant_mode = quantize(model, calib_loader, example)
+    artifacts['torchscript_int8'] = save_torchscript(int8_model, example, os.path.join(output_dir, 'model_int8.pt'))
+    for name, path in artifacts.items():
+        emit({"status": "export_artifact", "artifact": name, "path": path, "size_mb": file_mb(path)})
+
+    # --- Benchmark and compare the saved TorchScript models ---
+    exported = {
+        'fp32': torch.jit.load(artifacts['torchscript_fp32']),
+        'int8': torch.jit.load(artifacts['torchscript_int8']),
+    }
+    latency = {}
+    for name, net in exported.items():
+        latency[name] = measure_latency(net, IMAGE_SIZE, args.batch_size, args.latency_iters)
+        emit({"status": "export_latency", "variant": name, **latency[name]})
+
+    accuracy = None
+    if eval_dataset is not None and len(eval_dataset) > 0:
+        eval_loader = DataLoader(eval_dataset, batch_size=args.batch_size, num_workers=args.num_workers)
+        fp32_preds, labels = predict(exported['fp32'], eval_loader)
+        int8_preds, _ = predict(exported['int8'], eval_loader)
+        fp32_acc = (fp32_preds == labels).float().mean().item()
+        int8_acc = (int8_preds == labels).float().mean().item()
+        accuracy = {
+            "samples": len(labels),
+            "fp32_accuracy": round(fp32_acc, 4),
+            "int8_accuracy": round(int8_acc, 4),
+            "accuracy_drop": round(fp32_acc - int8_acc, 4),
+            "prediction_agreement": round((fp32_preds == int8_preds).float().mean().item(), 4),
+            "max_accuracy_drop": args.max_accuracy_drop,
+            "within_tolerance": fp32_acc - int8_acc <= args.max_accuracy_drop,
+        }
+        emit({"status": "export_accuracy", **accuracy})
+    else:
+        emit({"status": "export_info", "message": "No test or val split found; skipping the accuracy drift check."})
+
+    report = {
+        "model": args.model,
+        "checkpoint": os.path.abspath(checkpoint),
+        "classes": class_names,
+        "image_size": IMAGE_SIZE,
+        "mean": MEAN,
+        "std": STD,
+        "quantization": quant_mode,
+        "artifacts": {name: os.path.basename(path) for name, path in artifacts.items()},
+        "latency": latency,
+        "speedup_int8": round(latency['fp32']['p50_ms'] / latency['int8']['p50_ms'], 2),
+        "accuracy": accuracy,
+    }
+    report_path = os.path.join(output_dir, 'export_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    emit({"status": "export_complete", "report_path": report_path, **report})
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        emit({"status": "error", "message": str(e)})
+        sys.exit(1)
@@ -0,0 +1,118 @@
+"""
+Frozen-backbone feature cache.
+
+create_model() freezes every backbone parameter, so the backbone output for a
+given image never changes during training. This module runs the backbone once
+per split, stores the penultimate features in memory-mapped .npy files and
+serves them back in batches so only the classifier head has to be trained.
+"""
+import os
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+import model_factory
+from image_datasets import MemmapLoader, dataset_decoder, dataset_fingerprint
+from status_output import emit, emit_text
+
+CACHE_VERSION = 1
+
+
+def supports_feature_cache(model_name):
+    """DCN keeps its deformable blocks trainable, so its features are not fixed."""
+    return model_name != 'dcn'
+
+
+def _cache_key(model_name, dataset):
+    transform = getattr(getattr(dataset, 'dataset', dataset), 'transform', None)
+    return dataset_fingerprint(dataset, extra={
+        "version": CACHE_VERSION,
+        "model": model_name,
+        "transform": repr(transform),
+        "decoder": dataset_decoder(dataset),
+    })
+
+
+def _extract(model, dataset, cache_dir, device, batch_size, num_workers):
+    """Runs the (headless) model over the dataset and writes the cache files."""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    features_tmp = os.path.join(cache_dir, 'features.tmp.npy')
+    features = None
+    labels = np.empty(len(dataset), dtype=np.int64)
+    offset = 0
+
+    with torch.no_grad():
+        for inputs, targets in loader:
+            out = model(inputs.to(device)).float().cpu().numpy()
+            if features is None:
+                features = np.lib.format.open_memmap(
+                    features_tmp, mode='w+', dtype=np.float32, shape=(len(dataset), out.shape[1])
+                )
+            features[offset:offset + len(out)] = out
+            labels[offset:offset + len(out)] = targets.numpy()
+            offset += len(out)
+
+    features.flush()
+    del features
+    os.replace(features_tmp, os.path.join(cache_dir, 'features.npy'))
+    np.save(os.path.join(cache_dir, 'labels.npy'), labels)
+
+
+def load_or_build(model, model_name, dataset, cache_root, device, batch_size, num_workers=0):
+    """
+    Returns (features, labels) memory-mapped arrays for `dataset`, building
+    the cache on a miss. The cache is keyed by model name, the dataset's
+    file list (paths, sizes, mtimes) and the transform config.
+    """
+    key = _cache_key(model_name, dataset)
+    cache_dir = os.path.join(cache_root, key)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    hit = os.path.exists(meta_path)
+    start = time.time()
+
+    if not hit:
+        os.makedirs(cache_dir, exist_ok=True)
+        head = model_factory.get_head(model, model_name)
+        model_factory.set_head(model, model_name, nn.Identity())
+        was_training = model.training
+        model.eval()
+        try:
+            _extract(model, dataset, cache_dir, device, batch_size, num_workers)
+        finally:
+            model_factory.set_head(model, model_name, head)
+            model.train(was_training)
+        # meta.json is written last and marks the cache as complete
+        with open(meta_path, 'w') as f:
+            json.dump({"model": model_name, "samples": len(dataset), "version": CACHE_VERSION}, f)
+
+    features = np.load(os.path.join(cache_dir, 'features.npy'), mmap_mode='c')
+    labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+    emit({
+        "status": "feature_cache",
+        "cached": hit,
+        "samples": int(len(labels)),
+        "feature_dim": int(features.shape[1]),
+        "seconds": round(time.time() - start, 2),
+        "path": cache_dir,
+    })
+    return features, labels
+
+
+def build_feature_loaders(model, model_name, datasets_by_phase, cache_root, device, batch_size, num_workers=0):
+    """
+    Replaces image DataLoaders with feature MemmapLoaders for every non-empty phase.
+    Datasets must already use a deterministic (evaluation) transform.
+    """
+    loaders = {}
+    for phase, dataset in datasets_by_phase.items():
+        if dataset is None or len(dataset) == 0:
+            loaders[phase] = None
+            continue
+        emit_text(f"Preparing cached features for {phase} split...")
+        features, labels = load_or_build(model, model_name, dataset, cache_root, device, batch_size, num_workers)
+        loaders[phase] = MemmapLoader(features, labels, batch_size, shuffle=(phase == 'train'))
+    return loaders
@@ -0,0 +1,412 @@
+"""
+Dataset helpers shared by the training, sweep and caching code paths.
+"""
+import os
+import copy
+import json
+import hashlib
+import io
+import random
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler, Subset
+from torchvision import datasets
+
+from dataset_manifest import keep_class_dir
+from image_decode import describe_loader, pil_loader
+from status_output import emit_text
+
+# Written by pack_dataset.py next to the shard files of a packed class folder
+PACK_INDEX = 'pack_index.json'
+
+
+# ===============================
+# FILTERED IMAGEFOLDER (ignore experiments folder)
+# ===============================
+
+class FilteredImageFolder(datasets.ImageFolder):
+    """
+    ImageFolder that skips hidden and experiments folders. Given a
+    DatasetManifest covering `root`, classes and samples come from the
+    manifest instead of walking the directory tree. Files listed in
+    `exclude` (e.g. the integrity-check quarantine) are left out.
+    """
+
+    def __init__(self, root, transform=None, manifest=None, exclude=None, **kwargs):
+        self.manifest = manifest if manifest is not None and manifest.has_dir(root) else None
+        self.exclude = exclude or set()
+        super().__init__(root, transform, **kwargs)
+        # Only needed while make_dataset runs; don't pickle the whole tree into loader workers
+        self.manifest = None
+
+    def find_classes(self, directory):
+        if self.manifest is not None:
+            return self.manifest.find_classes(directory)
+
+        classes = []
+        for entry in os.scandir(directory):
+            if entry.is_dir() and keep_class_dir(entry.name):
+                classes.append(entry.name)
+
+        classes.sort()
+        class_to_idx = {cls_name: i for i, cls_name in enumerate(classes)}
+        return classes, class_to_idx
+
+    def make_dataset(self, directory, class_to_idx, extensions=None, is_valid_file=None, *args, **kwargs):
+        if self.manifest is not None and extensions is not None and is_valid_file is None:
+            instances = self.manifest.make_dataset(directory, class_to_idx, extensions)
+        else:
+            instances = super().make_dataset(directory, class_to_idx, extensions, is_valid_file, *args, **kwargs)
+        if self.exclude:
+            instances = [s for s in instances if os.path.abspath(s[0]) not in self.exclude]
+        return instances
+
+
+# ===============================
+# PACKED SHARD DATASET
+# ===============================
+
+def is_packed_dataset(path):
+    return os.path.isfile(os.path.join(path, PACK_INDEX))
+
+
+class ShardedImageFolder(Dataset):
+    """
+    Reads a class folder packed by pack_dataset.py: a few large shard files
+    holding the original encoded image bytes back to back, plus an offset
+    index. Exposes the same classes / class_to_idx / samples / targets
+    attributes as ImageFolder so it can be used anywhere one is expected.
+    """
+
+    def __init__(self, root, transform=None, loader=None):
+        self.root = root
+        self.transform = transform
+        self.loader = loader or pil_loader
+        with open(os.path.join(root, PACK_INDEX)) as f:
+            index = json.load(f)
+        self.classes = index["classes"]
+        self.class_to_idx = index["class_to_idx"]
+        self.shards = [os.path.join(root, name) for name in index["shards"]]
+        entries = index["samples"]
+        # Sample paths are virtual (root/class/file) and only used as identifiers
+        self.samples = [(os.path.join(root, rel), label) for rel, label, _, _, _ in entries]
+        self.targets = [label for _, label, _, _, _ in entries]
+        self.locations = np.array([(shard, offset, length) for _, _, shard, offset, length in entries], dtype=np.int64).reshape(-1, 3)
+        self._handles = {}
+        self._pid = None
+
+    def __getstate__(self):
+        # File handles cannot be pickled into DataLoader workers; reopen there
+        state = self.__dict__.copy()
+        state["_handles"] = {}
+        state["_pid"] = None
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _handle(self, shard):
+        if self._pid != os.getpid():
+            self._handles = {}
+            self._pid = os.getpid()
+        if shard not in self._handles:
+            self._handles[shard] = open(self.shards[shard], 'rb')
+        return self._handles[shard]
+
+    def read_bytes(self, index):
+        """Returns the original encoded bytes of one sample."""
+        shard, offset, length = (int(v) for v in self.locations[index])
+        f = self._handle(shard)
+        if hasattr(os, 'pread'):
+            return os.pread(f.fileno(), length, offset)
+        f.seek(offset)
+        return f.read(length)
+
+    def shard_of(self, index):
+        return int(self.locations[index][0])
+
+    def __getitem__(self, index):
+        sample = self.loader(io.BytesIO(self.read_bytes(index)))
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample, self.targets[index]
+
+
+def _resolve_indices(dataset):
+    """Maps a (possibly nested) Subset to (base dataset, base index per position)."""
+    if isinstance(dataset, Subset):
+        base, indices = _resolve_indices(dataset.dataset)
+        return base, [indices[i] for i in dataset.indices]
+    return dataset, list(range(len(dataset)))
+
+
+class ShardSequentialSampler(Sampler):
+    """
+    Shuffling sampler for packed datasets that keeps reads shard-sequential.
+    Each epoch visits the shards in random order and, inside a shard, walks
+    short runs of neighbouring samples (shuffled within the run). Samples
+    were shuffled across shards at pack time, so batches stay class-mixed.
+
+    With num_replicas > 1 every rank builds the same order from `seed` and
+    the epoch (see set_epoch) and takes its own contiguous slice of it,
+    padded like DistributedSampler so all ranks yield the same count; each
+    rank then reads a few whole shards rather than scattered samples.
+    """
+
+    def __init__(self, dataset, chunk_size=64, num_replicas=1, rank=0, seed=0):
+        self.chunk_size = chunk_size
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        base, indices = _resolve_indices(dataset)
+        by_shard = {}
+        for pos, base_idx in enumerate(indices):
+            shard, offset, _ = base.locations[base_idx]
+            by_shard.setdefault(int(shard), []).append((int(offset), pos))
+        self.shards = [[pos for _, pos in sorted(items)] for items in by_shard.values()]
+        self.total = sum(len(s) for s in self.shards)
+
+    def __len__(self):
+        return -(-self.total // self.num_replicas)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _order(self, rng):
+        for shard in rng.sample(self.shards, len(self.shards)):
+            chunks = [shard[i:i + self.chunk_size] for i in range(0, len(shard), self.chunk_size)]
+            rng.shuffle(chunks)
+            for chunk in chunks:
+                chunk = list(chunk)
+                rng.shuffle(chunk)
+                yield from chunk
+
+    def __iter__(self):
+        if self.num_replicas == 1:
+            yield from self._order(random.Random(torch.randint(0, 2**31, (1,)).item()))
+            return
+        order = list(self._order(random.Random(self.seed + self.epoch)))
+        per_rank = len(self)
+        while len(order) < per_rank * self.num_replicas:
+            order += order[:per_rank * self.num_replicas - len(order)]
+        yield from order[self.rank * per_rank:(self.rank + 1) * per_rank]
+
+
+def open_image_folder(path, transform=None, loader=None, manifest=None, exclude=None):
+    """
+    Opens a class-folder dataset, using the shard reader if it was packed.
+    `loader` overrides the image decoder (see image_decode.make_loader),
+    `manifest` (a DatasetManifest) avoids rescanning the folder and
+    `exclude` is a set of absolute paths to leave out.
+    """
+    if is_packed_dataset(path):
+        return ShardedImageFolder(path, transform, loader=loader)
+    if loader is not None:
+        return FilteredImageFolder(path, transform, manifest=manifest, exclude=exclude, loader=loader)
+    return FilteredImageFolder(path, transform, manifest=manifest, exclude=exclude)
+
+
+def load_manifest(data_dir, rescan=False, restat=False):
+    """Loads the shared dataset manifest, or None for packed datasets (which carry their own index)."""
+    if is_packed_dataset(data_dir) or is_packed_dataset(os.path.join(data_dir, 'train')):
+        return None
+    from dataset_manifest import DatasetManifest
+    try:
+        return DatasetManifest.load(data_dir, rescan=rescan, restat=restat)
+    except OSError as e:
+        emit_text(f"Warning: Could not load dataset manifest ({e}), scanning directly.")
+        return None
+
+
+def split_indices(targets, seed=42):
+    """
+    The 80/10/10 train/val/test split script.py uses for flat datasets
+    (stratified, falling back to a seeded random split), so other tools
+    can find the same test images.
+    """
+    total = len(targets)
+    train_len = int(0.8 * total)
+    val_len = int(0.1 * total)
+    indices = list(range(total))
+    from sklearn.model_selection import train_test_split
+    try:
+        train_idx, temp_idx, _, temp_targets = train_test_split(
+            indices, targets, train_size=train_len, stratify=targets, random_state=seed
+        )
+        val_idx, test_idx = train_test_split(
+            temp_idx, train_size=val_len, stratify=temp_targets, random_state=seed
+        )
+    except ValueError as e:
+        emit_text(f"Stratification failed ({e}), falling back to random split.")
+        order = torch.randperm(total, generator=torch.Generator().manual_seed(seed)).tolist()
+        train_idx = order[:train_len]
+        val_idx = order[train_len:train_len + val_len]
+        test_idx = order[train_len + val_len:]
+    return train_idx, val_idx, test_idx
+
+
+def train_sampling(dataset):
+    """DataLoader kwargs for a shuffled training split."""
+    if isinstance(_base_dataset(dataset), ShardedImageFolder):
+        return {"sampler": ShardSequentialSampler(dataset)}
+    return {"shuffle": True}
+
+
+def with_transform(dataset, transform, loader=None):
+    """
+    Returns a view of an ImageFolder (or a Subset of one) that applies
+    `transform` (and image `loader`, if given) instead of its own. The
+    sample list is shared, not copied.
+    """
+    if isinstance(dataset, Subset):
+        return Subset(with_transform(dataset.dataset, transform, loader), dataset.indices)
+    view = copy.copy(dataset)
+    view.transform = transform
+    if loader is not None:
+        view.loader = loader
+    return view
+
+
+def dataset_samples(dataset):
+    """Returns the (path, class_index) list of a dataset in iteration order."""
+    if isinstance(dataset, Subset):
+        base = dataset_samples(dataset.dataset)
+        return [base[i] for i in dataset.indices]
+    return list(dataset.samples)
+
+
+def _base_dataset(dataset):
+    while isinstance(dataset, Subset):
+        dataset = dataset.dataset
+    return dataset
+
+
+def dataset_decoder(dataset):
+    """Identifies the image decoder a dataset uses (part of cache keys)."""
+    return describe_loader(getattr(_base_dataset(dataset), 'loader', None))
+
+
+def sample_bytes(dataset, count=32):
+    """Encoded bytes of up to `count` evenly spaced samples (for decode benchmarks)."""
+    base, indices = _resolve_indices(dataset)
+    step = max(1, len(indices) // count)
+    blobs = []
+    for i in indices[::step][:count]:
+        if hasattr(base, 'read_bytes'):
+            blobs.append(base.read_bytes(i))
+        else:
+            with open(base.samples[i][0], 'rb') as f:
+                blobs.append(f.read())
+    return blobs
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return "missing"
+
+
+def samples_fingerprint(samples, extra=None, stamps=None):
+    """
+    Hashes a sample list together with each file's size and mtime, so any
+    added, removed, relabelled or rewritten image yields a new fingerprint.
+    `extra` is any JSON-serialisable config that should also key the result;
+    `stamps` (one string per sample) replaces the per-file stat.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(extra, sort_keys=True, default=str).encode())
+    for i, (path, label) in enumerate(samples):
+        stamp = stamps[i] if stamps is not None else _file_stamp(path)
+        h.update(f"{path}|{label}|{stamp}\n".encode())
+    return h.hexdigest()[:32]
+
+
+def dataset_fingerprint(dataset, extra=None):
+    """
+    samples_fingerprint of a dataset (or Subset). Packed datasets have
+    virtual sample paths, so each sample is stamped with its shard location
+    and the shard file's size and mtime instead; re-packing changed images
+    under the same names gives a new fingerprint.
+    """
+    base, indices = _resolve_indices(dataset)
+    samples = [base.samples[i] for i in indices]
+    if not isinstance(base, ShardedImageFolder):
+        return samples_fingerprint(samples, extra)
+    shard_stamps = [_file_stamp(path) for path in base.shards]
+    stamps = []
+    for i in indices:
+        shard, offset, length = (int(v) for v in base.locations[i])
+        stamps.append(f"{shard}:{shard_stamps[shard]}@{offset}+{length}")
+    return samples_fingerprint(samples, extra, stamps)
+
+
+class MemmapLoader:
+    """
+    Yields (inputs, labels) batches straight from a memory-mapped array.
+    Sequential batches are zero-copy slices; shuffled batches gather sorted
+    indices so reads stay as sequential as possible. `transform` is applied
+    to each whole batch tensor. `indices` (sorted) restricts it to a subset.
+    """
+
+    def __init__(self, data, labels, batch_size, shuffle=False, transform=None, indices=None):
+        self.data = data
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.transform = transform
+        self.indices = indices
+
+    def __len__(self):
+        n = len(self.labels) if self.indices is None else len(self.indices)
+        return (n + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        n = len(self.labels) if self.indices is None else len(self.indices)
+        order = torch.randperm(n).numpy() if self.shuffle else None
+        for start in range(0, n, self.batch_size):
+            if order is None:
+                idx = slice(start, start + self.batch_size)
+            else:
+                idx = np.sort(order[start:start + self.batch_size])
+            if self.indices is not None:
+                idx = self.indices[idx]
+            inputs = torch.from_numpy(self.data[idx])
+            if self.transform is not None:
+                inputs = self.transform(inputs)
+            yield inputs, torch.from_numpy(self.labels[idx])
+
+
+def loader_labels(loader):
+    """Class index of every sample a DataLoader or MemmapLoader yields, in order."""
+    if isinstance(loader, MemmapLoader):
+        labels = np.asarray(loader.labels)
+        return labels if loader.indices is None else labels[loader.indices]
+    return np.array([label for _, label in dataset_samples(loader.dataset)], dtype=np.int64)
+
+
+def subset_loader(loader, indices):
+    """The same (unshuffled) loader restricted to sorted positions `indices`."""
+    if isinstance(loader, MemmapLoader):
+        if loader.indices is not None:
+            indices = loader.indices[indices]
+        return MemmapLoader(loader.data, loader.labels, loader.batch_size, transform=loader.transform, indices=indices)
+    return DataLoader(
+        Subset(loader.dataset, [int(i) for i in indices]), batch_size=loader.batch_size, shuffle=False,
+        num_workers=loader.num_workers, pin_memory=loader.pin_memory,
+        prefetch_factor=loader.prefetch_factor, persistent_workers=loader.persistent_workers,
+        worker_init_fn=loader.worker_init_fn,
+    )
+
+
+def with_dataset(loader, dataset):
+    """A DataLoader like `loader` (batching, sampling, worker options) over another dataset of the same length."""
+    return DataLoader(
+        dataset, batch_size=loader.batch_size, sampler=loader.sampler,
+        num_workers=loader.num_workers, pin_memory=loader.pin_memory,
+        prefetch_factor=loader.prefetch_factor, persistent_workers=loader.persistent_workers,
+        worker_init_fn=loader.worker_init_fn,
+    )
@@ -0,0 +1,62 @@
+"""
+Import-time profiler for --profile_imports.
+
+Entry scripts start it before their heavy imports. It wraps
+builtins.__import__ and times every first import of a module: the
+cumulative time includes the modules that one imports in turn, the self
+time excludes them. report() stops profiling and returns the entry
+script's direct imports plus the slowest nested modules.
+"""
+import sys
+import time
+import builtins
+import importlib.util
+
+_original_import = builtins.__import__
+_records = []
+_stack = []
+
+
+def _resolve(name, globals, level):
+    if not level:
+        return name
+    try:
+        return importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+    except (ImportError, ValueError):
+        return name
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module = _resolve(name, globals, level)
+    if module in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    depth = len(_stack)
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        if module in sys.modules:
+            _records.append((module, depth, elapsed * 1000, (elapsed - children) * 1000))
+
+
+def start():
+    builtins.__import__ = _timed_import
+
+
+def report(top=15):
+    """Stops profiling; returns an import_profile event (times in ms)."""
+    builtins.__import__ = _original_import
+    direct = sorted((r for r in _records if r[1] == 0), key=lambda r: r[2], reverse=True)
+    nested = sorted((r for r in _records if r[1] > 0), key=lambda r: r[3], reverse=True)[:top]
+    return {
+        "status": "import_profile",
+        "total_ms": round(sum(r[2] for r in direct), 1),
+        "imports": [{"module": m, "cumulative_ms": round(c, 1), "self_ms": round(s, 1)} for m, _, c, s in direct],
+        "slowest_nested": [{"module": m, "self_ms": round(s, 1)} for m, _, _, s in nested],
+    }
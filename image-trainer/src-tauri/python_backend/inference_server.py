@@ -0,0 +1,284 @@
+"""
+Local inference server for models trained by script.py.
+
+Loads the model once and serves it over HTTP (ThreadingHTTPServer, one
+thread per connection):
+
+  POST /predict   Body is the encoded image (any Content-Type), or JSON
+                  {"path": "..."} for a file on this machine. Returns the
+                  prediction, confidence and top-k classes.
+  GET  /metrics   Queue depth, batch size histogram, latency percentiles.
+  GET  /health    {"status": "ok"} (the server listens once the model is loaded).
+
+Request threads decode and preprocess their own image, then hand the tensor
+to a single batching thread. The batcher starts a batch with the first
+waiting request and keeps adding requests until the batch is full or
+--max_latency_ms has passed since that first request, then runs the whole
+batch at once. Startup and shutdown are reported as JSON status lines on
+stdout for the EPOQ frontend.
+"""
+import io
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+
+from image_decode import DECODE_BACKENDS
+from precision import PRECISIONS, autocast, prepare_inputs, prepare_model
+from predict import Preprocessor, dataset_classes, load_predictor
+from status_output import emit
+
+
+class ServerMetrics:
+    """Thread-safe counters; latencies are kept for the most recent `window` requests."""
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+        self.latency_ms = deque(maxlen=window)
+        self.queue_ms = deque(maxlen=window)
+
+    def record_batch(self, size, queue_ms):
+        with self.lock:
+            self.batches += 1
+            self.batch_sizes[size] += 1
+            self.queue_ms.extend(queue_ms)
+
+    def record_request(self, latency_ms=None, error=False, rejected=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.rejected += rejected
+            if latency_ms is not None:
+                self.latency_ms.append(latency_ms)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": None, "p95": None, "p99": None}
+        values = np.asarray(values)
+        return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+    def snapshot(self, queue_depth):
+        with self.lock:
+            served = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                "uptime_sec": round(time.time() - self.started, 1),
+                "queue_depth": queue_depth,
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "mean_batch_size": round(served / self.batches, 2) if self.batches else None,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "latency_ms": self._percentiles(list(self.latency_ms)),
+                "queue_wait_ms": self._percentiles(list(self.queue_ms)),
+            }
+
+
+class DynamicBatcher:
+    """Coalesces single-image requests into batches bounded by size and by a latency window."""
+
+    def __init__(self, model, class_names, device, metrics, max_batch_size=32, max_latency_ms=10.0,
+                 max_queue=1024, top_k=3, precision='fp32', channels_last=False):
+        self.model = model
+        self.class_names = class_names
+        self.device = device
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.top_k = min(top_k, len(class_names))
+        self.precision = precision
+        self.channels_last = channels_last
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, tensor):
+        """Returns a Future with the top-k result; raises queue.Full when overloaded."""
+        future = Future()
+        self.queue.put_nowait((tensor, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                inputs = prepare_inputs(torch.stack([tensor for tensor, _, _ in batch]).to(self.device), self.channels_last)
+                with torch.inference_mode(), autocast(self.device, self.precision):
+                    probs = torch.softmax(self.model(inputs).float(), dim=1)
+                values, indices = probs.topk(self.top_k, dim=1)
+                for (_, future, _), row_idx, row_val in zip(batch, indices.tolist(), values.tolist()):
+                    future.set_result([(self.class_names[i], p) for i, p in zip(row_idx, row_val)])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            self.metrics.record_batch(len(batch), [(started - queued) * 1000 for _, _, queued in batch])
+
+
+def make_handler(batcher, preprocess, metrics):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # stdout carries JSON status lines only
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._reply(200, metrics.snapshot(batcher.queue.qsize()))
+            elif self.path == '/health':
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                try:
+                    source = json.loads(body)['path']
+                except (ValueError, KeyError, TypeError):
+                    metrics.record_request(error=True)
+                    self._reply(400, {"error": 'expected JSON {"path": ...} or an encoded image body'})
+                    return
+            else:
+                source = io.BytesIO(body)
+
+            tensor, error = preprocess(source)
+            if tensor is None:
+                metrics.record_request(error=True)
+                self._reply(400, {"error": error})
+                return
+            try:
+                future = batcher.submit(tensor)
+            except queue.Full:
+                metrics.record_request(rejected=True)
+                self._reply(503, {"error": "server overloaded"})
+                return
+            try:
+                topk = future.result()
+            except Exception as e:
+                metrics.record_request(error=True)
+                self._reply(500, {"error": str(e)})
+                return
+            latency_ms = (time.perf_counter() - start) * 1000
+            metrics.record_request(latency_ms)
+            self._reply(200, {
+                "prediction": topk[0][0],
+                "confidence": round(topk[0][1], 6),
+                "top_k": [{"class": name, "prob": round(prob, 6)} for name, prob in topk],
+                "latency_ms": round(latency_ms, 3),
+            })
+
+    return Handler
+
+
+def main():
+    import model_factory
+    parser = argparse.ArgumentParser(description='EPOQ local inference server')
+    parser.add_argument('--model', type=str, required=True, choices=list(model_factory.get_available_models()), help='Architecture the checkpoint was trained with')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Trained checkpoint (default: ~/.epoq_runs/best_model.pth)')
+    parser.add_argument('--path', type=str, default=None, help='Training dataset, to recover the class names')
+    parser.add_argument('--classes', type=str, default=None, help='Comma-separated class names in label order (instead of --path)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--max_batch_size', type=int, default=32, help='Largest batch the batcher forms')
+    parser.add_argument('--max_latency_ms', type=float, default=10.0, help='Longest a request waits for others to join its batch')
+    parser.add_argument('--max_queue', type=int, default=1024, help='Requests waiting beyond this are rejected with 503')
+    parser.add_argument('--top_k', type=int, default=3, help='Number of top classes returned per image')
+    parser.add_argument('--decode_backend', type=str, default='pil', choices=DECODE_BACKENDS, help='Image decoder: pil or draft (reduced-scale JPEG decode)')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS, help='Numeric precision: fp32 or bf16 (autocast)')
+    parser.add_argument('--channels_last', action='store_true', help='Use the channels_last memory format')
+    args = parser.parse_args()
+
+    if args.classes:
+        class_names = [name.strip() for name in args.classes.split(',') if name.strip()]
+    elif args.path and os.path.exists(args.path):
+        class_names = dataset_classes(args.path)
+    else:
+        emit({"status": "error", "message": "Class names are required: pass --path (training dataset) or --classes."})
+        return
+    checkpoint = args.checkpoint or os.path.join(os.path.expanduser("~"), ".epoq_runs", "best_model.pth")
+    if not os.path.exists(checkpoint):
+        emit({"status": "error", "message": f"Checkpoint not found: {checkpoint}"})
+        return
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    try:
+        model = load_predictor(args.model, checkpoint, len(class_names), device)
+    except (RuntimeError, ValueError) as e:
+        emit({"status": "error", "message": f"Could not load checkpoint for {args.model}: {e}"})
+        return
+    prepare_model(model, args.channels_last)
+
+    metrics = ServerMetrics()
+    batcher = DynamicBatcher(
+        model, class_names, device, metrics, args.max_batch_size, args.max_latency_ms,
+        args.max_queue, args.top_k, args.precision, args.channels_last,
+    )
+    handler = make_handler(batcher, Preprocessor(args.decode_backend), metrics)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    # Stopping with SIGTERM still reports the final metrics
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    emit({
+        "status": "server_started",
+        "host": args.host,
+        "port": server.server_address[1],
+        "model": args.model,
+        "device": str(device),
+        "num_classes": len(class_names),
+    })
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        emit({"status": "server_stopped", **metrics.snapshot(batcher.queue.qsize())})
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        emit({"status": "error", "message": str(e)})
+        sys.exit(1)
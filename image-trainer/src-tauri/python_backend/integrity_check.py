@@ -0,0 +1,157 @@
+"""
+Image Integrity Check - Pre-flight verification of every image in a dataset.
+
+Fully decodes each image in a process pool and writes a quarantine list of
+the files that fail (truncated, corrupt or unsupported). Training datasets
+exclude quarantined files automatically. Results are cached per file (size
+and mtime), so only new or changed files are decoded again on later runs.
+Outputs JSON status lines to stdout for the EPOQ frontend.
+"""
+import sys
+import json
+import os
+import time
+import argparse
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from dataset_manifest import DatasetManifest
+from status_output import emit
+
+CACHE_VERSION = 1
+
+
+def default_integrity_dir():
+    return os.path.join(os.path.expanduser("~"), ".epoq_runs", "integrity")
+
+
+def _paths_for(root, integrity_dir=None):
+    digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    base = os.path.join(integrity_dir or default_integrity_dir(), digest)
+    return base + '.cache.json', base + '.quarantine.json'
+
+
+def verify_image(path):
+    """Fully decodes one image. Returns (path, error message or None)."""
+    try:
+        with Image.open(path) as img:
+            img.load()
+        return path, None
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}"
+
+
+def load_quarantine(root, integrity_dir=None):
+    """Absolute paths of quarantined files for `root` (empty if never verified)."""
+    _, quarantine_path = _paths_for(root, integrity_dir)
+    try:
+        with open(quarantine_path) as f:
+            return {entry["path"] for entry in json.load(f)["files"]}
+    except (OSError, ValueError, KeyError):
+        return set()
+
+
+def _write_json(path, data):
+    # A private temp file per writer, so concurrent processes never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def verify_dataset(root, manifest=None, workers=None, integrity_dir=None, progress=True):
+    """
+    Verifies every image under `root`, reusing cached results for files
+    whose size and mtime are unchanged. Streams verify_progress events
+    (unless `progress` is False) and returns a summary including the
+    quarantine list path.
+    """
+    start = time.time()
+    root = os.path.abspath(root)
+    cache_path, quarantine_path = _paths_for(root, integrity_dir)
+    manifest = manifest or DatasetManifest.load(root, restat=True)
+
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache.get("version") != CACHE_VERSION:
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    cached_files = cache.get("files", {})
+
+    results = {}
+    pending = []
+    for path, _ in manifest.iter_files():
+        # Stat here rather than trust the manifest: cheap next to a full decode
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        size, mtime_ns = st.st_size, st.st_mtime_ns
+        prev = cached_files.get(path)
+        if prev and prev[0] == size and prev[1] == mtime_ns:
+            results[path] = prev
+        else:
+            results[path] = [size, mtime_ns, None]
+            pending.append(path)
+
+    total = len(pending)
+    bad_new = 0
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        report_every = max(1, total // 50)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, min(64, total // (workers * 4)))
+            for done, (path, error) in enumerate(pool.map(verify_image, pending, chunksize=chunksize), 1):
+                results[path][2] = error
+                bad_new += error is not None
+                if progress and (done % report_every == 0 or done == total):
+                    emit({"status": "verify_progress", "done": done, "total": total, "bad": bad_new})
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    _write_json(cache_path, {"version": CACHE_VERSION, "root": root, "files": results})
+
+    quarantined = [{"path": path, "error": entry[2]} for path, entry in sorted(results.items()) if entry[2]]
+    _write_json(quarantine_path, {
+        "root": root,
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "files": quarantined,
+    })
+
+    return {
+        "status": "verify_complete",
+        "total_images": len(results),
+        "verified": total,
+        "cached": len(results) - total,
+        "quarantined": len(quarantined),
+        "quarantine_path": quarantine_path,
+        "seconds": round(time.time() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify every image in a dataset')
+    parser.add_argument('--path', type=str, required=True, help='Path to dataset')
+    parser.add_argument('--workers', type=int, default=None, help='Verification processes (default: all cores)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path):
+        emit({"status": "error", "message": f"Directory not found: {args.path}"})
+        sys.exit(1)
+
+    emit(verify_dataset(args.path, workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+DataLoader throughput autotuner.
+
+Benchmarks a short burst of batches under several DataLoader configurations
+(worker count, prefetch depth, pinned memory) and picks the fastest. The
+choice is cached per machine, dataset, batch size, decoder and transform
+in the runs directory so later runs skip the probe.
+"""
+import os
+import json
+import time
+import hashlib
+import platform
+
+import torch
+from torch.utils.data import DataLoader
+
+from image_datasets import dataset_decoder, train_sampling
+from status_output import emit
+
+CACHE_FILE = 'loader_tuning.json'
+
+
+def candidate_configs(cpu_count=None, pin_memory=None):
+    """Loader configurations worth probing on this machine."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    worker_counts = sorted({w for w in (0, 2, 4, 8, 16, cpu_count // 2) if w <= cpu_count})
+    configs = []
+    for workers in worker_counts:
+        if workers == 0:
+            configs.append({"num_workers": 0, "pin_memory": pin_memory})
+            continue
+        for prefetch in (2, 4):
+            configs.append({
+                "num_workers": workers,
+                "pin_memory": pin_memory,
+                "prefetch_factor": prefetch,
+                "persistent_workers": True,
+            })
+    return configs
+
+
+def measure_throughput(dataset, batch_size, config, num_batches=10):
+    """
+    Images/sec over `num_batches` batches, excluding worker start-up and the
+    first batch. Reads in the order training does (shard-sequential for
+    packed datasets).
+    """
+    loader = DataLoader(dataset, batch_size=batch_size, **train_sampling(dataset), **config)
+    it = iter(loader)
+    next(it, None)
+    images = 0
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        batch = next(it, None)
+        if batch is None:
+            break
+        images += len(batch[1])
+    elapsed = time.perf_counter() - start
+    del it  # shuts the worker processes down
+    return images / elapsed if elapsed > 0 else 0.0
+
+
+def _cache_key(dataset, batch_size):
+    base = dataset
+    while hasattr(base, 'dataset'):
+        base = base.dataset
+    ident = {
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "dataset": os.path.abspath(getattr(base, 'root', '')),
+        "samples": len(dataset),
+        "batch_size": batch_size,
+        # The decode backend and transform decide the per-sample cost
+        "decoder": dataset_decoder(dataset),
+        "transform": repr(getattr(base, 'transform', None)),
+    }
+    return hashlib.sha256(json.dumps(ident, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def autotune(dataset, batch_size, cache_dir, num_batches=10, configs=None):
+    """
+    Returns the fastest DataLoader kwargs for `dataset`, probing every
+    candidate configuration unless a cached result for this machine,
+    dataset, batch size and pipeline exists.
+    """
+    cache_path = os.path.join(cache_dir, CACHE_FILE)
+    cache = _load_cache(cache_path)
+    key = _cache_key(dataset, batch_size)
+
+    if key in cache:
+        entry = cache[key]
+        emit({"status": "loader_autotune_complete", "cached": True, **entry})
+        return entry["config"]
+
+    # Limit the probe to the batches we actually time (+1 warm-up batch)
+    num_batches = min(num_batches, max(1, len(dataset) // batch_size - 1))
+    results = []
+    for config in configs or candidate_configs():
+        try:
+            ips = measure_throughput(dataset, batch_size, config, num_batches)
+        except Exception as e:
+            emit({"status": "loader_autotune", "config": config, "error": str(e)})
+            ips = 0.0
+        else:
+            emit({"status": "loader_autotune", "config": config, "images_per_sec": round(ips, 1)})
+        results.append((config, ips))
+
+    best_config, best_ips = max(results, key=lambda r: r[1])
+    entry = {
+        "config": best_config,
+        "images_per_sec": round(best_ips, 1),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    cache[key] = entry
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+    emit({"status": "loader_autotune_complete", "cached": False, **entry})
+    return best_config
+
+
+def rebuild_loader(loader, config):
+    """Recreates a DataLoader with the same dataset, batching, sampling and worker_init_fn but new loader kwargs."""
+    return DataLoader(
+        loader.dataset, batch_size=loader.batch_size, sampler=loader.sampler,
+        worker_init_fn=loader.worker_init_fn, **config
+    )
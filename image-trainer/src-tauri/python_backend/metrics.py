@@ -0,0 +1,72 @@
+"""
+On-device metric accumulation for the training, validation and sweep loops.
+
+Loss sums and a confusion tally are kept as tensors on the training device
+and only read back once per phase, so the per-batch loop never forces a
+host sync. Correct and sample counts are derived from the confusion tally.
+"""
+import torch
+
+
+class EpochMetrics:
+    def __init__(self, num_classes=None):
+        # Inferred from the first batch of outputs when not given
+        self.num_classes = num_classes
+        self.loss_sum = None
+        self.confusion = None
+
+    def _allocate(self, num_classes, device):
+        self.num_classes = num_classes
+        self.loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        self.confusion = torch.zeros(num_classes * num_classes, dtype=torch.int64, device=device)
+
+    def update(self, loss, outputs, labels):
+        """Adds one batch; `loss` is the batch mean, as returned by CrossEntropyLoss."""
+        if self.confusion is None:
+            self._allocate(self.num_classes or outputs.shape[1], labels.device)
+        preds = outputs.detach().argmax(dim=1)
+        self.loss_sum += loss.detach().double() * labels.numel()
+        # index_add_ stays on the device; bincount reads its max back to size the output
+        cells = labels.long() * self.num_classes + preds
+        self.confusion.index_add_(0, cells, torch.ones_like(cells))
+
+    def all_reduce(self, device='cpu'):
+        """Sums the tallies over every rank of the default process group (num_classes must be set)."""
+        import torch.distributed as dist
+        if self.confusion is None:
+            self._allocate(self.num_classes, device)
+        dist.all_reduce(self.loss_sum)
+        dist.all_reduce(self.confusion)
+
+    def compute(self, class_names=None):
+        """
+        Reads the tallies back (one transfer each) and returns loss,
+        accuracy, sample count, the confusion matrix (rows = true class) and,
+        with `class_names`, per-class precision/recall/support.
+        """
+        if self.confusion is None:
+            return {"loss": 0.0, "accuracy": 0.0, "samples": 0, "confusion": None}
+        confusion = self.confusion.view(self.num_classes, self.num_classes).cpu()
+        samples = int(confusion.sum())
+        correct = int(confusion.diagonal().sum())
+        result = {
+            "loss": float(self.loss_sum.cpu()) / max(samples, 1),
+            "accuracy": correct / max(samples, 1),
+            "samples": samples,
+            "confusion": confusion.numpy(),
+        }
+        if class_names is not None:
+            true_pos = confusion.diagonal().double()
+            predicted = confusion.sum(dim=0).double()
+            support = confusion.sum(dim=1)
+            precision = torch.where(predicted > 0, true_pos / predicted.clamp(min=1), torch.zeros_like(true_pos))
+            recall = torch.where(support > 0, true_pos / support.clamp(min=1), torch.zeros_like(true_pos))
+            result["per_class"] = {
+                name: {
+                    "precision": round(float(precision[i]), 4),
+                    "recall": round(float(recall[i]), 4),
+                    "support": int(support[i]),
+                }
+                for i, name in enumerate(class_names)
+            }
+        return result
@@ -0,0 +1,116 @@
+"""
+Cache of models built by model_factory.create_model.
+
+Building a model loads the pretrained torchvision/timm weights, patches in
+the deformable blocks for dcn and replaces the head, which takes seconds.
+
+  In process  A pristine CPU copy per (architecture, class count) is kept;
+              each request gets a deep copy (e.g. one per sweep trial).
+  On disk     The whole built module is saved under
+              ~/.epoq_runs/model_cache and memory-mapped on load. The key
+              covers the architecture, class count, torch/torchvision/timm
+              versions and the model_factory source, so changes to any of
+              them build the model again. The most recent entries are kept.
+
+Every copy gets a freshly initialized classification head, so runs and
+trials still start from independent random heads as with create_model.
+"""
+import os
+import copy
+import json
+import time
+import hashlib
+import importlib.metadata
+
+import torch
+
+import model_factory
+from status_output import emit, emit_text
+
+_PRISTINE = {}
+
+
+def _version(package):
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def cache_key(model_name, num_classes):
+    with open(model_factory.__file__, 'rb') as f:
+        source = hashlib.sha1(f.read()).hexdigest()
+    key = json.dumps({
+        "model": model_name,
+        "num_classes": num_classes,
+        "torch": torch.__version__,
+        "torchvision": _version('torchvision'),
+        "timm": _version('timm') if model_name == 'eva02' else None,
+        "model_factory": source,
+    }, sort_keys=True)
+    return f"{model_name}-{num_classes}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+
+def _load_or_build(model_name, num_classes, cache_dir):
+    """(pristine CPU model, source) where source is 'disk' or 'built'."""
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, cache_key(model_name, num_classes) + '.pt')
+        if os.path.exists(path):
+            try:
+                # The cache only holds modules this code saved itself
+                model = torch.load(path, map_location='cpu', mmap=True, weights_only=False)
+                os.utime(path)
+                return model, 'disk'
+            except Exception as e:
+                emit_text(f"[Model Cache] Ignoring unreadable cache entry ({e}).")
+
+    model, _ = model_factory.create_model(model_name, num_classes, torch.device('cpu'))
+    if path is not None:
+        from checkpoint_writer import atomic_save
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            atomic_save(model, path)
+            _prune(cache_dir)
+        except OSError as e:
+            emit_text(f"[Model Cache] Could not write cache entry ({e}).")
+    return model, 'built'
+
+
+def _prune(cache_dir, keep_last=8):
+    entries = sorted(
+        (entry for entry in os.scandir(cache_dir) if entry.name.endswith('.pt')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in entries[keep_last:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def create_model(model_name, num_classes, device, cache_dir=None, keep_in_memory=True):
+    """
+    Drop-in for model_factory.create_model: returns (model,
+    parameters_to_optimize). `cache_dir` enables the on-disk cache;
+    one-shot callers pass keep_in_memory=False to skip the pristine copy.
+    """
+    start = time.perf_counter()
+    key = (model_name, num_classes)
+    if key in _PRISTINE:
+        model, source = copy.deepcopy(_PRISTINE[key]), 'memory'
+    else:
+        model, source = _load_or_build(model_name, num_classes, cache_dir)
+        if keep_in_memory:
+            _PRISTINE[key] = model
+            model = copy.deepcopy(model)
+
+    model_factory.get_head(model, model_name).reset_parameters()
+    model = model.to(device)
+    emit({
+        "status": "model_cache",
+        "model": model_name,
+        "source": source,
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    return model, [p for p in model.parameters() if p.requires_grad]
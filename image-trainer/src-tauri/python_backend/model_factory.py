@@ -7,6 +7,8 @@ from torchvision.models import (
     MobileNet_V3_Large_Weights, ViT_B_16_Weights, ConvNeXt_Tiny_Weights
 )
 
+from status_output import emit_text
+
 # --- Custom Blocks ---
 class DeformableBlock(nn.Module):
     def __init__(self, in_channels, out_channels, kernel_size=3, stride=1, padding=1, groups=1, bias=False):
@@ -70,47 +72,77 @@ def get_available_models():
         'convnext': 'ConvNeXt (Modern ConvNet)'
     }
 
+# Attribute path of the replaced classification head for each architecture
+# (everything not listed here uses the standard ResNet ``fc`` head)
+HEAD_PATHS = {
+    'eva02': 'head',
+    'efficientnet_b0': 'classifier.1',
+    'mobilenet_v3': 'classifier.3',
+    'vit_b_16': 'heads.head',
+    'convnext': 'classifier.2',
+}
+
+def get_head(model, model_name):
+    """Returns the trainable classification head created by create_model."""
+    return model.get_submodule(HEAD_PATHS.get(model_name, 'fc'))
+
+def set_head(model, model_name, module):
+    """Swaps the classification head in place (e.g. for nn.Identity)."""
+    parent_path, _, attr = HEAD_PATHS.get(model_name, 'fc').rpartition('.')
+    parent = model.get_submodule(parent_path) if parent_path else model
+    setattr(parent, attr, module)
+
 def create_model(model_name, num_classes, device):
-    print(f"[Model Factory] Initializing {model_name}...", flush=True)
+    emit_text(f"[Model Factory] Initializing {model_name}...")
     
     model = None
     
     # 1. Base Model Creation & Configuration
+    # `weights_id` names the pretrained weights; delta checkpoints record it
     if model_name == 'dcn':
         # DCN uses ResNet18 as base
         model = models.resnet18(weights=ResNet18_Weights.DEFAULT)
-        print("[Model Factory] Applying Deformable Convolutions...", flush=True)
+        weights_id = f"torchvision:{ResNet18_Weights.DEFAULT}"
+        emit_text("[Model Factory] Applying Deformable Convolutions...")
         _replace_layers_with_dcn(model)
         
     elif model_name == 'resnet18':
         model = models.resnet18(weights=ResNet18_Weights.DEFAULT)
+        weights_id = f"torchvision:{ResNet18_Weights.DEFAULT}"
         
     elif model_name == 'resnet50':
         model = models.resnet50(weights=ResNet50_Weights.DEFAULT)
+        weights_id = f"torchvision:{ResNet50_Weights.DEFAULT}"
         
     elif model_name == 'efficientnet_b0':
         model = models.efficientnet_b0(weights=EfficientNet_B0_Weights.DEFAULT)
+        weights_id = f"torchvision:{EfficientNet_B0_Weights.DEFAULT}"
         
     elif model_name == 'eva02':
         # Using EVA-02 Base Patch14 224
         # Note: Requires timm installed
-        print("[Model Factory] Loading EVA-02 from timm...", flush=True)
+        emit_text("[Model Factory] Loading EVA-02 from timm...")
         import timm
         try:
             model = timm.create_model('eva02_base_patch14_224.mim_in22k_ft_in1k', pretrained=True)
+            weights_id = "timm:eva02_base_patch14_224.mim_in22k_ft_in1k"
         except Exception:
             # Fallback if specific tag fails or newer timm version
-            print("[Model Factory] Specific EVA-02 tag failed, trying generic 'eva02_base_patch14_224'...", flush=True)
+            emit_text("[Model Factory] Specific EVA-02 tag failed, trying generic 'eva02_base_patch14_224'...")
             model = timm.create_model('eva02_base_patch14_224', pretrained=True)
+            weights_id = "timm:eva02_base_patch14_224"
 
     elif model_name == 'mobilenet_v3':
         model = models.mobilenet_v3_large(weights=MobileNet_V3_Large_Weights.DEFAULT)
+        weights_id = f"torchvision:{MobileNet_V3_Large_Weights.DEFAULT}"
 
     elif model_name == 'vit_b_16':
         model = models.vit_b_16(weights=ViT_B_16_Weights.DEFAULT)
+        weights_id = f"torchvision:{ViT_B_16_Weights.DEFAULT}"
 
     elif model_name == 'convnext':
         model = models.convnext_tiny(weights=ConvNeXt_Tiny_Weights.DEFAULT)
+        weights_id = f"torchvision:{ConvNeXt_Tiny_Weights.DEFAULT}"
 
     else:
         raise ValueError(f"Unknown model name: {model_name}")
@@ -152,6 +184,7 @@ def create_model(model_name, num_classes, device):
 
     # 4. Move to Device
     model = model.to(device)
+    model.backbone_identity = {"architecture": model_name, "weights": weights_id}
     
     # 5. Return model and optimized parameters
     parameters_to_optimize = [p for p in model.parameters() if p.requires_grad]
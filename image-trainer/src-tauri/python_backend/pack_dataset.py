@@ -0,0 +1,112 @@
+"""
+Dataset Packer - Converts class-folder datasets into large shard files.
+
+Reading one small file per sample is slow on network and spinning-disk
+volumes. This script copies the encoded images of a class folder back to
+back into a few shard files plus an offset index (pack_index.json) that
+image_datasets.ShardedImageFolder reads. Structured datasets are packed
+split by split, so the packed tree has the same train/val/test layout.
+"""
+import sys
+import json
+import os
+import argparse
+import random
+
+from image_datasets import PACK_INDEX, FilteredImageFolder
+from status_output import emit
+
+INDEX_VERSION = 1
+
+
+def pack_image_folder(src_dir, out_dir, shard_size_mb=256, seed=42):
+    """
+    Packs one class folder into out_dir. Samples are shuffled across shards
+    (with a fixed seed) so shard-sequential reading still yields mixed batches.
+    Returns the number of packed images.
+    """
+    if os.path.exists(os.path.join(out_dir, PACK_INDEX)):
+        raise FileExistsError(f"{out_dir} already contains a packed dataset")
+    os.makedirs(out_dir, exist_ok=True)
+
+    folder = FilteredImageFolder(src_dir)
+    order = list(range(len(folder.samples)))
+    random.Random(seed).shuffle(order)
+
+    shard_limit = shard_size_mb * 1024 * 1024
+    shards = []
+    entries = []
+    out = None
+    report_every = max(1, len(order) // 20)
+
+    try:
+        for done, idx in enumerate(order, 1):
+            path, label = folder.samples[idx]
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            if out is None or (out.tell() > 0 and out.tell() + len(data) > shard_limit):
+                if out is not None:
+                    out.close()
+                shards.append(f"shard_{len(shards):05d}.bin")
+                out = open(os.path.join(out_dir, shards[-1]), 'wb')
+
+            entries.append([os.path.relpath(path, src_dir), label, len(shards) - 1, out.tell(), len(data)])
+            out.write(data)
+
+            if done % report_every == 0 or done == len(order):
+                emit({"status": "pack_progress", "split_dir": src_dir, "done": done, "total": len(order)})
+    finally:
+        if out is not None:
+            out.close()
+
+    # The index is written last; a pack without one is incomplete
+    index = {
+        "version": INDEX_VERSION,
+        "classes": folder.classes,
+        "class_to_idx": folder.class_to_idx,
+        "shards": shards,
+        "samples": entries,
+    }
+    tmp_path = os.path.join(out_dir, PACK_INDEX + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(out_dir, PACK_INDEX))
+    return len(entries)
+
+
+def pack_dataset(src, out, shard_size_mb=256):
+    """Packs a flat class folder, or each of its train/val/test split folders."""
+    splits = [name for name in ('train', 'val', 'validation', 'test') if os.path.isdir(os.path.join(src, name))]
+    if 'train' not in splits:
+        splits = ['']
+
+    totals = {}
+    for split in splits:
+        count = pack_image_folder(os.path.join(src, split), os.path.join(out, split), shard_size_mb)
+        totals[split or "root"] = count
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack an image dataset into shard files')
+    parser.add_argument('--src', type=str, required=True, help='Path to the class-folder dataset')
+    parser.add_argument('--out', type=str, required=True, help='Output directory for the packed dataset')
+    parser.add_argument('--shard_mb', type=int, default=256, help='Target shard size in MB')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.src):
+        emit({"status": "error", "message": f"Directory not found: {args.src}"})
+        sys.exit(1)
+
+    try:
+        totals = pack_dataset(args.src, args.out, args.shard_mb)
+    except Exception as e:
+        emit({"status": "error", "message": f"Packing failed: {e}"})
+        sys.exit(1)
+
+    emit({"status": "pack_complete", "path": args.out, "splits": totals})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Numeric precision and memory layout options for training.
+
+  fp32  Full precision (default).
+  bf16  Forward pass and loss run under torch.autocast with bfloat16, which
+        maps to the AVX-512 BF16 / AMX units of recent Xeon CPUs. Weights,
+        gradients and optimizer state stay fp32.
+
+channels_last stores the model's 4D weights and the input batches as NHWC,
+the layout oneDNN convolutions prefer on CPU.
+"""
+import copy
+import time
+import contextlib
+
+import torch
+
+PRECISIONS = ('fp32', 'bf16')
+
+
+def autocast(device, precision):
+    """Context manager for the forward pass and loss of one step."""
+    if precision == 'bf16':
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def prepare_model(model, channels_last):
+    """Converts the model's parameters in place, so optimizer references stay valid."""
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+
+def prepare_inputs(inputs, channels_last):
+    """Channels-last copy of an image batch; feature batches (2D) are returned as is."""
+    if channels_last and inputs.dim() == 4:
+        return inputs.contiguous(memory_format=torch.channels_last)
+    return inputs
+
+
+def _train_images_per_sec(net, criterion, inputs, labels, device, precision, steps):
+    net.train()
+    start = None
+    for step in range(steps + 1):  # the first step is a warmup
+        if step == 1:
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+        with autocast(device, precision):
+            loss = criterion(net(inputs), labels)
+        loss.backward()
+        net.zero_grad(set_to_none=True)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return steps * len(inputs) / (time.perf_counter() - start)
+
+
+def benchmark(net, criterion, inputs, labels, device, precision, channels_last, steps=5):
+    """
+    Times forward + backward on one batch in fp32 and in the requested mode,
+    on a copy of `net` so its weights and BatchNorm statistics are untouched.
+    """
+    probe = copy.deepcopy(net)
+    fp32 = _train_images_per_sec(probe, criterion, inputs, labels, device, 'fp32', steps)
+    prepare_model(probe, channels_last)
+    tuned = _train_images_per_sec(
+        probe, criterion, prepare_inputs(inputs, channels_last), labels, device, precision, steps
+    )
+    del probe
+    return {
+        "precision": precision,
+        "channels_last": channels_last,
+        "fp32_images_per_sec": round(fp32, 1),
+        "images_per_sec": round(tuned, 1),
+        "speedup_vs_fp32": round(tuned / fp32, 3),
+    }
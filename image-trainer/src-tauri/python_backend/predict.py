@@ -0,0 +1,362 @@
+"""
+Batch prediction CLI for models trained by script.py.
+
+Streams images from a folder (recursively), a glob pattern or a text file
+with one path per line through a thread pool that decodes and preprocesses
+them, runs large batches under torch.inference_mode and appends one record
+per input image to a CSV or JSONL file. Only a few batches are in flight at
+a time, so memory stays bounded however many images there are.
+
+Inputs are enumerated in a deterministic order (directory entries are
+sorted, also when walking a glob pattern) and every input produces exactly one output record (unreadable
+images get an `error`), so an interrupted run resumes by skipping as many
+inputs as the output file already has records.
+
+Outputs JSON status lines to stdout for the EPOQ frontend.
+"""
+import os
+import sys
+import csv
+import fnmatch
+import re
+import json
+import time
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from image_datasets import open_image_folder, load_manifest
+from image_decode import DECODE_BACKENDS, make_loader, pil_loader
+from dataset_manifest import IMAGE_EXTENSIONS
+from checkpoint_format import load_checkpoint
+from precision import PRECISIONS, autocast, prepare_inputs, prepare_model
+from export_model import IMAGE_SIZE, eval_transform
+from status_output import emit
+
+RECOVER_CHUNK = 1 << 20
+_GLOB_MAGIC = re.compile(r'[*?[]')
+
+
+def _sorted_entries(directory, follow_symlinks=True):
+    """(name, is_dir) of a directory's entries, sorted by name (empty if unreadable)."""
+    try:
+        with os.scandir(directory or '.') as it:
+            return sorted((entry.name, entry.is_dir(follow_symlinks=follow_symlinks)) for entry in it)
+    except OSError:
+        return []
+
+
+def _walk_sorted(root):
+    """Image files under `root`, depth first, with each directory's entries sorted."""
+    for name, is_dir in _sorted_entries(root, follow_symlinks=False):
+        path = os.path.join(root, name)
+        if is_dir:
+            yield from _walk_sorted(path)
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            yield path
+
+
+def _glob_sorted(directory, parts):
+    """
+    Paths under `directory` matching the glob components `parts` ('**'
+    spans any number of directories), depth first with each directory's
+    entries sorted. Like glob, hidden names only match patterns that start
+    with a dot.
+    """
+    head, rest = parts[0], parts[1:]
+    if head == '**':
+        if rest:
+            yield from _glob_sorted(directory, rest)
+        for name, is_dir in _sorted_entries(directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            if is_dir:
+                yield from _glob_sorted(path, parts)
+            elif not rest:
+                yield path
+        return
+    for name, is_dir in _sorted_entries(directory):
+        if name.startswith('.') and not head.startswith('.'):
+            continue
+        if not fnmatch.fnmatch(name, head):
+            continue
+        path = os.path.join(directory, name)
+        if not rest:
+            yield path
+        elif is_dir:
+            yield from _glob_sorted(path, rest)
+
+
+def iter_glob(pattern):
+    """
+    Streams the matches of a recursive glob in a deterministic order. The
+    literal leading directories are the root and only the rest of the
+    pattern is walked, one sorted directory listing at a time.
+    """
+    parts = os.path.normpath(pattern).split(os.sep)
+    split = 0
+    while split < len(parts) - 1 and not _GLOB_MAGIC.search(parts[split]):
+        split += 1
+    root = parts[:split]
+    if root and (root[0] == '' or root[0].endswith(':')):
+        root[0] += os.sep  # filesystem or drive root
+    yield from _glob_sorted(os.path.join(*root) if root else '', parts[split:])
+
+
+def iter_inputs(source):
+    """Image paths from a directory, a .txt/.lst file list, or a glob pattern."""
+    if os.path.isdir(source):
+        yield from _walk_sorted(source)
+    elif os.path.isfile(source) and source.lower().endswith(('.txt', '.lst')):
+        with open(source) as f:
+            for line in f:
+                path = line.strip()
+                if path:
+                    yield path
+    else:
+        for path in iter_glob(source):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+
+
+def dataset_classes(data_dir):
+    """Class names in the order script.py assigned label indices."""
+    train_dir = os.path.join(data_dir, 'train')
+    root = train_dir if os.path.isdir(train_dir) else data_dir
+    return open_image_folder(root, manifest=load_manifest(data_dir)).classes
+
+
+def load_predictor(model_name, checkpoint, num_classes, device):
+    import model_factory
+    model, _ = model_factory.create_model(model_name, num_classes, device)
+    load_checkpoint(checkpoint, model, device)
+    return model.eval()
+
+
+class Preprocessor:
+    def __init__(self, decode_backend='pil', image_size=IMAGE_SIZE):
+        self.loader = make_loader(decode_backend, image_size) or pil_loader
+        self.transform = eval_transform(image_size)
+
+    def __call__(self, path):
+        """(tensor, None) or (None, error message)."""
+        try:
+            return self.transform(self.loader(path)), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+
+class PredictionWriter:
+    """Appends prediction records to CSV or JSONL; knows how many records are already there."""
+
+    def __init__(self, path, fmt, top_k):
+        self.path = path
+        self.fmt = fmt
+        self.top_k = top_k
+        self.done = self._recover()
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='')
+        self.csv = None
+        if fmt == 'csv':
+            self.csv = csv.writer(self.file)
+            if is_new:
+                header = ['path', 'prediction', 'confidence']
+                for i in range(1, top_k + 1):
+                    header += [f'top{i}_class', f'top{i}_prob']
+                self.csv.writerow(header + ['error'])
+
+    def _recover(self):
+        """Drops a partially written last record and counts the complete ones, reading in fixed-size chunks."""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            # Scan back from the end for the last newline
+            end = 0
+            pos = size
+            while pos > 0:
+                start = max(0, pos - RECOVER_CHUNK)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                pos = start
+            if end < size:
+                f.truncate(end)
+            f.seek(0)
+            records = 0
+            remaining = end
+            while remaining:
+                block = f.read(min(RECOVER_CHUNK, remaining))
+                records += block.count(b'\n')
+                remaining -= len(block)
+        if self.fmt == 'csv' and records:
+            records -= 1  # header
+        return records
+
+    def write(self, path, topk=None, error=None):
+        if self.fmt == 'csv':
+            row = [path]
+            if topk:
+                row += [topk[0][0], f"{topk[0][1]:.6f}"]
+                for name, prob in topk:
+                    row += [name, f"{prob:.6f}"]
+                row += ['', ''] * (self.top_k - len(topk))
+            else:
+                row += [''] * (2 + 2 * self.top_k)
+            self.csv.writerow(row + [error or ''])
+        else:
+            record = {"path": path}
+            if topk:
+                record.update({
+                    "prediction": topk[0][0],
+                    "confidence": round(topk[0][1], 6),
+                    "top_k": [{"class": name, "prob": round(prob, 6)} for name, prob in topk],
+                })
+            if error:
+                record["error"] = error
+            self.file.write(json.dumps(record) + '\n')
+        self.done += 1
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def predict_stream(model, paths, writer, class_names, preprocess, device, batch_size=256,
+                   decode_threads=8, prefetch_batches=2, precision='fp32', channels_last=False,
+                   progress_every=10):
+    """
+    Runs the decode pool and the model over `paths`, writing one record per
+    path in input order. At most `prefetch_batches` decoded batches wait
+    ahead of the model.
+    """
+    top_k = writer.top_k
+    paths = iter(paths)
+    pending = deque()
+    processed = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=decode_threads) as pool:
+        def submit_next():
+            chunk = list(itertools.islice(paths, batch_size))
+            if chunk:
+                pending.append((chunk, [pool.submit(preprocess, path) for path in chunk]))
+            return bool(chunk)
+
+        for _ in range(prefetch_batches + 1):
+            if not submit_next():
+                break
+
+        batches = 0
+        while pending:
+            chunk, futures = pending.popleft()
+            submit_next()
+            results = [future.result() for future in futures]
+            tensors = [tensor for tensor, _ in results if tensor is not None]
+            topk_rows = iter(())
+            if tensors:
+                inputs = prepare_inputs(torch.stack(tensors).to(device), channels_last)
+                with torch.inference_mode(), autocast(device, precision):
+                    probs = torch.softmax(model(inputs).float(), dim=1)
+                values, indices = probs.topk(min(top_k, probs.shape[1]), dim=1)
+                topk_rows = iter([
+                    [(class_names[i], p) for i, p in zip(row_idx, row_val)]
+                    for row_idx, row_val in zip(indices.tolist(), values.tolist())
+                ])
+            for path, (tensor, error) in zip(chunk, results):
+                if tensor is None:
+                    writer.write(path, error=error)
+                else:
+                    writer.write(path, next(topk_rows))
+            writer.flush()
+            processed += len(chunk)
+            batches += 1
+            if batches % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                emit({
+                    "status": "predict_progress",
+                    "processed": writer.done,
+                    "images_per_sec": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+                })
+    return processed, time.perf_counter() - start
+
+
+def main():
+    import model_factory
+    parser = argparse.ArgumentParser(description='EPOQ batch prediction')
+    parser.add_argument('--input', type=str, required=True, help='Image folder (recursive), glob pattern, or .txt file with one image path per line')
+    parser.add_argument('--output', type=str, required=True, help='Predictions file (.csv or .jsonl); an existing file is resumed')
+    parser.add_argument('--model', type=str, required=True, choices=list(model_factory.get_available_models()), help='Architecture the checkpoint was trained with')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Trained checkpoint (default: ~/.epoq_runs/best_model.pth)')
+    parser.add_argument('--path', type=str, default=None, help='Training dataset, to recover the class names')
+    parser.add_argument('--classes', type=str, default=None, help='Comma-separated class names in label order (instead of --path)')
+    parser.add_argument('--format', type=str, default=None, choices=['csv', 'jsonl'], help='Output format (default: from the --output extension)')
+    parser.add_argument('--top_k', type=int, default=3, help='Number of top classes recorded per image')
+    parser.add_argument('--batch_size', type=int, default=256, help='Inference batch size')
+    parser.add_argument('--decode_threads', type=int, default=None, help='Decode/preprocess threads (default: min(8, CPU count))')
+    parser.add_argument('--decode_backend', type=str, default='pil', choices=DECODE_BACKENDS, help='Image decoder: pil or draft (reduced-scale JPEG decode)')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS, help='Numeric precision: fp32 or bf16 (autocast)')
+    parser.add_argument('--channels_last', action='store_true', help='Use the channels_last memory format')
+    args = parser.parse_args()
+
+    if args.classes:
+        class_names = [name.strip() for name in args.classes.split(',') if name.strip()]
+    elif args.path and os.path.exists(args.path):
+        class_names = dataset_classes(args.path)
+    else:
+        emit({"status": "error", "message": "Class names are required: pass --path (training dataset) or --classes."})
+        return
+    checkpoint = args.checkpoint or os.path.join(os.path.expanduser("~"), ".epoq_runs", "best_model.pth")
+    if not os.path.exists(checkpoint):
+        emit({"status": "error", "message": f"Checkpoint not found: {checkpoint}"})
+        return
+    fmt = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    try:
+        model = load_predictor(args.model, checkpoint, len(class_names), device)
+    except (RuntimeError, ValueError) as e:
+        emit({"status": "error", "message": f"Could not load checkpoint for {args.model}: {e}"})
+        return
+    prepare_model(model, args.channels_last)
+
+    writer = PredictionWriter(args.output, fmt, min(args.top_k, len(class_names)))
+    skipped = writer.done
+    emit({"status": "predict_started", "model": args.model, "output": args.output, "format": fmt, "resumed_from": skipped})
+
+    decode_threads = args.decode_threads or min(8, os.cpu_count() or 1)
+    paths = itertools.islice(iter_inputs(args.input), skipped, None)
+    try:
+        processed, elapsed = predict_stream(
+            model, paths, writer, class_names, Preprocessor(args.decode_backend), device,
+            batch_size=args.batch_size, decode_threads=decode_threads,
+            precision=args.precision, channels_last=args.channels_last,
+        )
+    finally:
+        writer.close()
+    emit({
+        "status": "predict_complete",
+        "output": args.output,
+        "total": writer.done,
+        "processed": processed,
+        "resumed_from": skipped,
+        "images_per_sec": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+    })
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        emit({"status": "error", "message": str(e)})
+        sys.exit(1)
@@ -0,0 +1,27 @@
+"""
+Progressive-resizing schedule.
+
+Training epochs are split into consecutive stages of increasing resolution
+(e.g. 128 -> 160 -> 224); the last stage always runs at the model's full
+resolution, and validation/test always use full-resolution images. Convolutional
+models accept any input size, so only the train DataLoader is rebuilt at
+stage boundaries. The transformer models have fixed-size position
+embeddings and always train at full resolution.
+"""
+
+FIXED_RESOLUTION_MODELS = ('vit_b_16', 'eva02')
+
+
+def parse_sizes(spec, full_size):
+    """'128,160,224' -> [128, 160, 224]; sizes above full_size are dropped and full_size is always last."""
+    sizes = sorted({int(part) for part in spec.split(',') if part.strip()})
+    sizes = [size for size in sizes if 0 < size < full_size]
+    return sizes + [full_size]
+
+
+def epoch_resolutions(num_epochs, sizes):
+    """Resolution per epoch: equal-length stages, with any remainder going to the larger sizes."""
+    stages = min(len(sizes), max(num_epochs, 1))
+    # Keep the largest sizes when there are fewer epochs than stages
+    sizes = sizes[len(sizes) - stages:]
+    return [sizes[stages - 1 - (num_epochs - 1 - epoch) * stages // num_epochs] for epoch in range(num_epochs)]
@@ -0,0 +1,190 @@
+"""
+Background resource sampler for training and sweep processes.
+
+A daemon thread wakes every --monitor_interval seconds and emits one compact
+resource_sample event:
+
+  cpu / iowait      System CPU and I/O-wait percent since the previous sample
+  proc_cpu          This process's CPU percent (100 = one core busy)
+  rss_mb            Resident memory of this process, and of its children
+  workers           Live child processes (DataLoader workers) and their mean
+                    CPU percent: near 100 means the loaders are saturated
+  read_mbps         Disk read throughput, system-wide and by this process
+                    tree (Linux)
+  swap_out_mbps     Pages written to swap; anything sustained means the
+                    machine is out of memory
+
+Rates cover the time since the previous sample, so nothing blocks (unlike
+psutil.cpu_percent(interval=...)). The thread measures its own CPU time,
+and at exit a resource_summary event reports peaks, means and the
+sampler's overhead as a percentage of one core. Needs psutil; without it
+the monitor reports that and stays off.
+"""
+import time
+import atexit
+import threading
+
+from status_output import emit
+
+MIN_INTERVAL = 0.5
+MB = 1024 ** 2
+
+
+class ResourceMonitor:
+    def __init__(self, interval, source='training'):
+        import psutil
+        self.psutil = psutil
+        self.interval = max(MIN_INTERVAL, interval)
+        self.source = source
+        self.process = psutil.Process()
+        self.children = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='resource-monitor', daemon=True)
+        self.samples = 0
+        self.sampler_cpu = 0.0
+        self.peak = {"cpu": 0.0, "proc_cpu": 0.0, "rss_mb": 0.0, "child_rss_mb": 0.0, "read_mbps": 0.0}
+        self.totals = {"cpu": 0.0, "iowait": 0.0, "proc_cpu": 0.0, "worker_cpu": 0.0}
+        self.started = None
+
+    def start(self):
+        # Prime the delta-based counters
+        self.psutil.cpu_times_percent(None)
+        self.process.cpu_percent(None)
+        self.last_time = time.perf_counter()
+        self.last_disk = self._disk_read()
+        self.last_tree_read = self._tree_read()
+        self.last_swap_out = self._swap_out()
+        self.started = time.perf_counter()
+        self.thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        if self.started is None or self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.thread.join(timeout=self.interval + 1)
+        elapsed = time.perf_counter() - self.started
+        n = max(self.samples, 1)
+        emit({
+            "status": "resource_summary",
+            "source": self.source,
+            "samples": self.samples,
+            "interval_sec": self.interval,
+            "peak": {k: round(v, 1) for k, v in self.peak.items()},
+            "mean": {k: round(v / n, 1) for k, v in self.totals.items()},
+            "sampler_cpu_ms": round(self.sampler_cpu * 1000, 1),
+            "overhead_percent": round(100 * self.sampler_cpu / elapsed, 3) if elapsed > 0 else 0.0,
+        })
+
+    def _disk_read(self):
+        counters = self.psutil.disk_io_counters()
+        return counters.read_bytes if counters else 0
+
+    def _swap_out(self):
+        try:
+            return self.psutil.swap_memory().sout
+        except (RuntimeError, OSError):
+            return 0
+
+    def _tree_read(self):
+        total = 0
+        for proc in [self.process] + list(self.children.values()):
+            try:
+                total += proc.io_counters().read_bytes
+            except (self.psutil.Error, AttributeError):
+                pass
+        return total
+
+    def _refresh_children(self):
+        """Keeps one Process object per child, since cpu_percent measures from the previous call on it."""
+        try:
+            current = {proc.pid: proc for proc in self.process.children(recursive=True)}
+        except self.psutil.Error:
+            current = {}
+        for pid, proc in current.items():
+            if pid not in self.children:
+                self.children[pid] = proc
+                try:
+                    proc.cpu_percent(None)
+                except self.psutil.Error:
+                    pass
+        for pid in list(self.children):
+            if pid not in current:
+                del self.children[pid]
+
+    def sample(self):
+        psutil = self.psutil
+        now = time.perf_counter()
+        dt = max(now - self.last_time, 1e-6)
+        self.last_time = now
+
+        cpu_times = psutil.cpu_times_percent(None)
+        cpu = 100.0 - cpu_times.idle
+        iowait = getattr(cpu_times, 'iowait', 0.0)
+        proc_cpu = self.process.cpu_percent(None)
+        rss_mb = self.process.memory_info().rss / MB
+
+        self._refresh_children()
+        worker_cpu, child_rss = [], 0
+        for proc in list(self.children.values()):
+            try:
+                worker_cpu.append(proc.cpu_percent(None))
+                child_rss += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        child_rss_mb = child_rss / MB
+
+        disk = self._disk_read()
+        tree_read = self._tree_read()
+        swap_out = self._swap_out()
+        read_mbps = max(disk - self.last_disk, 0) / MB / dt
+        proc_read_mbps = max(tree_read - self.last_tree_read, 0) / MB / dt
+        swap_mbps = max(swap_out - self.last_swap_out, 0) / MB / dt
+        self.last_disk, self.last_tree_read, self.last_swap_out = disk, tree_read, swap_out
+
+        mean_worker = sum(worker_cpu) / len(worker_cpu) if worker_cpu else 0.0
+        for key, value in (("cpu", cpu), ("proc_cpu", proc_cpu), ("rss_mb", rss_mb),
+                           ("child_rss_mb", child_rss_mb), ("read_mbps", read_mbps)):
+            self.peak[key] = max(self.peak[key], value)
+        for key, value in (("cpu", cpu), ("iowait", iowait), ("proc_cpu", proc_cpu), ("worker_cpu", mean_worker)):
+            self.totals[key] += value
+        self.samples += 1
+
+        return {
+            "status": "resource_sample",
+            "source": self.source,
+            "cpu": round(cpu, 1),
+            "iowait": round(iowait, 1),
+            "proc_cpu": round(proc_cpu, 1),
+            "rss_mb": round(rss_mb, 1),
+            "child_rss_mb": round(child_rss_mb, 1),
+            "workers": len(worker_cpu),
+            "worker_cpu": round(mean_worker, 1),
+            "read_mbps": round(read_mbps, 2),
+            "proc_read_mbps": round(proc_read_mbps, 2),
+            "mem_percent": psutil.virtual_memory().percent,
+            "swap_out_mbps": round(swap_mbps, 2),
+        }
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            cpu_start = time.thread_time()
+            try:
+                event = self.sample()
+            except Exception as e:
+                event = {"status": "resource_sample", "source": self.source, "error": str(e)}
+            event["sampler_ms"] = round((time.thread_time() - cpu_start) * 1000, 2)
+            emit(event)
+            self.sampler_cpu += time.thread_time() - cpu_start
+
+
+def start_monitor(interval, source='training'):
+    """Starts a ResourceMonitor, or returns None if interval <= 0 or psutil is missing."""
+    if not interval or interval <= 0:
+        return None
+    try:
+        return ResourceMonitor(interval, source).start()
+    except ImportError:
+        emit({"status": "info", "message": "Resource monitoring needs psutil (pip install psutil); continuing without it."})
+        return None
@@ -0,0 +1,161 @@
+"""
+CPU resource planner shared by script.py and automl_sweep.py.
+
+Splits the cores this process may use between PyTorch intra-op threads,
+inter-op threads and DataLoader workers, so that they do not oversubscribe
+the machine (by default PyTorch starts one intra-op thread per core and
+the loader workers compete with them).
+
+  off   Leave PyTorch and the loaders at their defaults.
+  auto  Reserve cores for the loader workers and give the rest to intra-op
+        threads.
+  numa  Like auto, restricted to one NUMA node: the training threads and
+        each loader worker are pinned to cores of that node, so memory
+        stays local. (Use distributed training to cover several sockets.)
+"""
+import os
+
+import torch
+from torch.utils.data import DataLoader
+
+CPU_PLANS = ('off', 'auto', 'numa')
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _parse_cpulist(text):
+    cpus = []
+    for part in text.strip().split(','):
+        if '-' in part:
+            low, high = part.split('-')
+            cpus.extend(range(int(low), int(high) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_nodes():
+    """{node id: [cpu, ...]} from sysfs; empty where NUMA topology is not exposed."""
+    base = '/sys/devices/system/node'
+    nodes = {}
+    try:
+        names = os.listdir(base)
+    except OSError:
+        return nodes
+    for name in names:
+        if name.startswith('node') and name[4:].isdigit():
+            try:
+                with open(os.path.join(base, name, 'cpulist')) as f:
+                    nodes[int(name[4:])] = _parse_cpulist(f.read())
+            except OSError:
+                pass
+    return nodes
+
+
+def default_loader_workers(num_cpus):
+    """About a quarter of the cores feed the model (decode + augment), within 1..8."""
+    if num_cpus <= 2:
+        return 0
+    return max(1, min(8, num_cpus // 4))
+
+
+class WorkerAffinity:
+    """DataLoader worker_init_fn pinning worker i to its own core (picklable for spawn)."""
+
+    def __init__(self, cpus):
+        self.cpus = list(cpus)
+
+    def __call__(self, worker_id):
+        if hasattr(os, 'sched_setaffinity') and self.cpus:
+            os.sched_setaffinity(0, {self.cpus[worker_id % len(self.cpus)]})
+        torch.set_num_threads(1)
+
+
+class CpuPlan:
+    def __init__(self, mode, cpus, intra_op_threads, interop_threads, loader_workers,
+                 numa_node=None, main_cpus=None, worker_cpus=None, unused_cpus=0):
+        self.mode = mode
+        self.cpus = cpus
+        self.unused_cpus = unused_cpus
+        self.intra_op_threads = intra_op_threads
+        self.interop_threads = interop_threads
+        self.loader_workers = loader_workers
+        self.numa_node = numa_node
+        self.main_cpus = main_cpus
+        self.worker_cpus = worker_cpus
+
+    @property
+    def worker_init_fn(self):
+        return WorkerAffinity(self.worker_cpus) if self.worker_cpus else None
+
+    def report(self):
+        return {
+            "status": "cpu_plan",
+            "mode": self.mode,
+            "cpus": len(self.cpus),
+            "unused_cpus": self.unused_cpus,
+            "intra_op_threads": self.intra_op_threads,
+            "interop_threads": self.interop_threads,
+            "loader_workers": self.loader_workers,
+            "numa_node": self.numa_node,
+            "main_cpus": self.main_cpus,
+            "worker_cpus": self.worker_cpus,
+        }
+
+
+def make_plan(mode, loader_workers=None):
+    """
+    Plans the split for `mode`. `loader_workers` is the worker count the
+    loaders will use (None picks default_loader_workers); cores left after
+    the workers go to intra-op threads.
+    """
+    cpus = all_cpus = available_cpus()
+    numa_node = None
+    if mode == 'numa':
+        nodes = {node: [c for c in node_cpus if c in set(cpus)] for node, node_cpus in numa_nodes().items()}
+        nodes = {node: node_cpus for node, node_cpus in nodes.items() if node_cpus}
+        if nodes:
+            numa_node = max(nodes, key=lambda node: len(nodes[node]))
+            cpus = nodes[numa_node]
+            # Cores on other nodes are left for other ranks (see distributed.py)
+
+    if loader_workers is None:
+        loader_workers = default_loader_workers(len(cpus))
+    # Workers share cores with the training threads only when there are too few cores
+    reserved = min(loader_workers, max(len(cpus) - 1, 0))
+    intra_op = max(1, len(cpus) - reserved)
+    interop = 1 if intra_op < 8 else 2
+
+    main_cpus = worker_cpus = None
+    if mode == 'numa':
+        main_cpus = cpus[:intra_op]
+        worker_cpus = cpus[intra_op:] or cpus
+    return CpuPlan(mode, cpus, intra_op, interop, loader_workers, numa_node, main_cpus, worker_cpus,
+                   len(all_cpus) - len(cpus))
+
+
+def apply_plan(plan):
+    """Sets the thread pools (and pins this process for numa). Interop threads can only be set once, early."""
+    if plan.main_cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, plan.main_cpus)
+    torch.set_num_threads(plan.intra_op_threads)
+    try:
+        torch.set_num_interop_threads(plan.interop_threads)
+    except RuntimeError:
+        plan.interop_threads = torch.get_num_interop_threads()
+
+
+def pin_loader(loader, plan):
+    """Rebuilds a DataLoader so its workers follow the plan's core pinning."""
+    if not isinstance(loader, DataLoader) or plan.worker_init_fn is None or loader.num_workers == 0:
+        return loader
+    return DataLoader(
+        loader.dataset, batch_size=loader.batch_size, sampler=loader.sampler,
+        num_workers=loader.num_workers, pin_memory=loader.pin_memory,
+        prefetch_factor=loader.prefetch_factor, persistent_workers=loader.persistent_workers,
+        worker_init_fn=plan.worker_init_fn,
+    )
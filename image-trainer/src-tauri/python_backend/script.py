@@ -2,56 +2,57 @@ import sys
 import json
 import time
 import argparse
+import math
 import os
 import subprocess
+import contextlib
+import importlib.util
+
+from status_output import emit, emit_text
+
+if __name__ == "__main__" and '--profile_imports' in sys.argv:
+    # Started before the heavy imports below so that they are measured
+    import import_profiler
+    import_profiler.start()
 
 def _install_missing(module_name, pip_name=None):
     if pip_name is None:
         pip_name = module_name
-    try:
-        __import__(module_name)
-    except ImportError:
-        print(json.dumps({"status": "info", "message": f"Installing missing dependency: {pip_name}..."}), flush=True)
+    # find_spec locates the package without importing (executing) it
+    if importlib.util.find_spec(module_name) is None:
+        emit({"status": "info", "message": f"Installing missing dependency: {pip_name}..."})
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", pip_name])
         except Exception as e:
-            print(json.dumps({"status": "error", "message": f"Failed to install {pip_name}: {e}"}), flush=True)
-
+            emit({"status": "error", "message": f"Failed to install {pip_name}: {e}"})
 
+if __name__ == "__main__":
+    # Checked before the imports below, which need them
+    _install_missing("torch")
+    _install_missing("torchvision")
+    _install_missing("numpy")
+    _install_missing("sklearn", "scikit-learn")
+    _install_missing("pandas")
+    _install_missing("matplotlib")
+    _install_missing("seaborn")
 
 import torch
 import torch.nn as nn
 import torch.optim as optim
-import torchvision
-from torchvision import datasets, models, transforms
+from torchvision import transforms
 
-import numpy as np
-from sklearn.metrics import classification_report, confusion_matrix
 from torch.utils.data import DataLoader, Subset
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
+# sklearn, matplotlib and seaborn are imported in the evaluation block, where they are used
 from augmentation_builder import build_transforms
-# ===============================
-# FILTERED IMAGEFOLDER (ignore experiments folder)
-# ===============================
-
-class FilteredImageFolder(datasets.ImageFolder):
-    def find_classes(self, directory):
-        classes = []
-        for entry in os.scandir(directory):
-            if (
-                entry.is_dir()
-                and not entry.name.startswith(".")
-                and entry.name.lower() != "experiments"
-            ):
-                classes.append(entry.name)
-
-        classes.sort()
-        class_to_idx = {cls_name: i for i, cls_name in enumerate(classes)}
-        return classes, class_to_idx
+from image_datasets import open_image_folder, is_packed_dataset, load_manifest, train_sampling, loader_labels, subset_loader, split_indices
+from image_decode import DECODE_BACKENDS, make_loader
+from precision import PRECISIONS, autocast, prepare_inputs, prepare_model
+from metrics import EpochMetrics
+from checkpoint_format import CHECKPOINT_FORMATS, load_checkpoint, model_payload, training_payload
+from val_schedule import FULL, SUBSET, ValidationSchedule, stratified_subsample
+from step_profiler import StepProfiler, TraceWindow
+from resource_planner import CPU_PLANS, apply_plan, available_cpus, default_loader_workers, make_plan, pin_loader
+
 def main():
     parser = argparse.ArgumentParser(description='PyTorch Trainer')
     parser.add_argument('--path', type=str, required=True, help='Path to dataset')
@@ -64,11 +65,58 @@ def main():
     parser.add_argument('--only_zip', action='store_true', help='Exit after creating dataset zip')
     parser.add_argument('--evaluate_only', action='store_true', help='Skip training and only evaluate the model')
     parser.add_argument('--num_workers', type=int, default=-1, help='Number of data loading workers (default: dynamic, set to 0 to disable multiprocessing)')
+    parser.add_argument('--autotune_loader', action='store_true', help='Benchmark DataLoader configurations before training and use the fastest (cached per machine and dataset)')
+    parser.add_argument('--cpu_plan', type=str, default='off', choices=CPU_PLANS, help='Split CPU cores between PyTorch threads and loader workers: off, auto, or numa (also pin them to cores of one NUMA node)')
     parser.add_argument('--experiment_id', type=str, default=None, help='Unique experiment identifier (auto-generated by UI)')
     parser.add_argument('--patience', type=int, default=5, help='Early stopping patience (epochs without val loss improvement)')
+    parser.add_argument('--distributed_ranks', type=int, default=None, help='Data-parallel CPU training with this many processes per machine (0 = one per CPU socket)')
+    parser.add_argument('--nnodes', type=int, default=1, help='Number of machines in distributed training')
+    parser.add_argument('--node_rank', type=int, default=0, help='Index of this machine in distributed training (0 hosts the rendezvous)')
+    parser.add_argument('--master_addr', type=str, default='127.0.0.1', help='Rendezvous address (node 0) for distributed training')
+    parser.add_argument('--master_port', type=int, default=29500, help='Rendezvous port for distributed training')
+    parser.add_argument('--progressive_resize', type=str, default=None, help='Comma-separated training resolutions for successive epoch stages, e.g. 128,160,224 (convolutional models only; the last stage is always full resolution)')
+    parser.add_argument('--val_every', type=int, default=1, help='Validate every N epochs (the last epoch, and any epoch where early stopping could trigger, is always validated)')
+    parser.add_argument('--val_subsample', type=float, default=0.0, help='Fraction of the val split (stratified, fixed) used for early validations; 0 = always use the full split')
     parser.add_argument('--resume', type=str, required=False, default=None, help='Path to a checkpoint .pth file to resume training from')
     parser.add_argument('--augmentation',type=str,default='{}',help='JSON string for augmentation configuration')
+    parser.add_argument('--feature_cache', action='store_true', help='Train only the classifier head on cached frozen-backbone features (augmentation is not applied)')
+    parser.add_argument('--batch_augment', action='store_true', help='Load uint8 images in workers and apply augmentation/normalization to whole batches in the training process')
+    parser.add_argument('--verify_images', action='store_true', help='Fully decode every image before training and quarantine unreadable files (cached per file)')
+    parser.add_argument('--rescan_dataset', action='store_true', help='Rebuild the dataset manifest from scratch instead of refreshing it incrementally')
+    parser.add_argument('--decode_backend', type=str, default='pil', choices=DECODE_BACKENDS, help='Image decoder: pil (full decode) or draft (reduced-scale JPEG decode near the target size)')
+    parser.add_argument('--cache_eval_images', action='store_true', help='Cache decoded, resized val/test images in a memory-mapped file reused across epochs and runs')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS, help='Numeric precision: fp32, or bf16 (autocast forward/loss, e.g. on AVX-512/AMX CPUs)')
+    parser.add_argument('--channels_last', action='store_true', help='Use the channels_last (NHWC) memory format for the model and input batches')
+    parser.add_argument('--keep_checkpoints', type=int, default=3, help='Number of per-epoch checkpoints to keep (written in the background)')
+    parser.add_argument('--checkpoint_format', type=str, default='full', choices=CHECKPOINT_FORMATS, help='full: complete state_dict; delta: only trainable weights and buffers on top of the pretrained backbone')
+    parser.add_argument('--monitor_interval', type=float, default=0, help='Emit CPU/RAM/disk/loader-worker telemetry every N seconds during the run (0 = off)')
+    parser.add_argument('--exact_step_timing', action='store_true', help='Synchronize the GPU at each step phase so the step_profile breakdown is exact (slower)')
+    parser.add_argument('--trace_steps', type=int, default=0, help='Record a torch.profiler trace of this many training steps into <runs>/traces (0 = off)')
+    parser.add_argument('--trace_skip', type=int, default=10, help='Training steps to run before the trace window starts')
+    parser.add_argument('--profile_imports', action='store_true', help='Report the import time of each module loaded at startup')
+    parser.add_argument('--model_cache', action='store_true', help='Reuse the built model (pretrained weights, patched layers, new head) saved on disk by earlier runs')
+    parser.add_argument('--compile', action='store_true', help='Compile the model with torch.compile, reusing compiled kernels cached on disk across runs')
     args = parser.parse_args()
+    if args.profile_imports:
+        import import_profiler
+        emit(import_profiler.report())
+
+    # --- Distributed data parallel: the launcher re-runs this script once per rank ---
+    dist_ctx = None
+    if args.distributed_ranks is not None and not args.only_zip:
+        import distributed
+        if not distributed.in_worker():
+            sys.exit(distributed.launch(args.distributed_ranks, args.nnodes, args.node_rank, args.master_addr, args.master_port))
+        dist_ctx = distributed.init_worker()
+    is_main_process = dist_ctx is None or dist_ctx.is_main
+    # Rank 0 runs cache-building sections first; the other ranks then reuse its files
+    main_first = dist_ctx.main_first if dist_ctx is not None else contextlib.nullcontext
+
+    if is_main_process:
+        # Samples until the process exits
+        from resource_monitor import start_monitor
+        start_monitor(args.monitor_interval)
+
     try:
        aug_config = json.loads(args.augmentation)
     except Exception:
@@ -81,13 +129,36 @@ def main():
     save_dir = base_runs_dir
     
     if not os.path.exists(data_dir):
-        print(json.dumps({"status": "error", "message": "Directory not found"}), flush=True)
+        emit({"status": "error", "message": "Directory not found"})
         return
 
-    print("Initializing training...", flush=True)
+    emit_text("Initializing training...")
+
+    # One manifest of the dataset tree replaces repeated directory walks below
+    # Rank 0 refreshes the manifest and verifies; the other ranks then read its results
+    with main_first():
+        manifest = load_manifest(data_dir, rescan=args.rescan_dataset and is_main_process,
+                                 restat=args.verify_images and is_main_process)
+        if manifest is not None:
+            emit({"status": "manifest", **manifest.last_refresh})
+
+        # Pre-flight integrity check; quarantined files are always left out of the datasets
+        if args.verify_images and manifest is not None and is_main_process:
+            from integrity_check import verify_dataset
+            emit_text("Verifying dataset images...")
+            emit(verify_dataset(data_dir, manifest))
+    from integrity_check import load_quarantine
+    quarantined = load_quarantine(data_dir)
+    if quarantined:
+        emit({
+            "status": "quarantine",
+            "excluded": len(quarantined),
+            "message": f"Excluding {len(quarantined)} unreadable image(s) found by the integrity check."
+        })
 
     # Build transforms dynamically
-    train_transform, val_transform = build_transforms(aug_config, image_size=224)
+    image_size = 224
+    train_transform, val_transform = build_transforms(aug_config, image_size=image_size)
     # Add normalization (always applied after ToTensor)
     normalize = transforms.Normalize(
          [0.485, 0.456, 0.406],
@@ -106,6 +177,27 @@ def main():
         'train': train_transform,
         'val': val_transform
     }
+
+    # Batched augmentation: workers only decode/resize to uint8, the rest runs per batch
+    batch_pipeline = None
+    if args.batch_augment:
+        from batch_augment import BatchAugment, build_uint8_transform
+        batch_pipeline = BatchAugment(aug_config)
+        data_transforms = {
+            'train': build_uint8_transform(image_size),
+            'val': build_uint8_transform(image_size)
+        }
+        emit_text("Using batched tensor augmentation (uint8 loader transport).")
+    # Decoders per split; draft mode keeps enough resolution for the train crop window
+    train_decode_size = image_size
+    crop_cfg = aug_config.get("randomResizedCrop", {})
+    if crop_cfg.get("enabled") and not args.batch_augment:
+        train_decode_size = int(image_size / math.sqrt(crop_cfg.get("scaleMin", 0.8)))
+    image_loaders = {
+        'train': make_loader(args.decode_backend, train_decode_size),
+        'val': make_loader(args.decode_backend, image_size)
+    }
+
     dataloaders = {}
     dataset_sizes = {}
     class_names = []
@@ -123,6 +215,8 @@ def main():
     
     if args.num_workers >= 0:
         num_workers = args.num_workers
+    elif args.cpu_plan != 'off':
+        num_workers = default_loader_workers(len(available_cpus()))
     else:
         try:
             cpu_count = os.cpu_count() or 1
@@ -134,27 +228,27 @@ def main():
             num_workers = 0
 
     if os.path.isdir(train_dir):
-        print("Detected structured dataset (train/val/test).", flush=True)
+        emit_text("Detected structured dataset (train/val/test).")
         
         # Train
-        train_dataset = FilteredImageFolder(train_dir, data_transforms['train'])
-        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+        train_dataset = open_image_folder(train_dir, data_transforms['train'], image_loaders['train'], manifest, quarantined)
+        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, num_workers=num_workers, **train_sampling(train_dataset))
         dataset_sizes['train'] = len(train_dataset)
         class_names = train_dataset.classes
         
         # Val
         if os.path.isdir(val_dir):
-            val_dataset = FilteredImageFolder(val_dir, data_transforms['val'])
+            val_dataset = open_image_folder(val_dir, data_transforms['val'], image_loaders['val'], manifest, quarantined)
             dataloaders['val'] = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
             dataset_sizes['val'] = len(val_dataset)
         else:
-            print("Warning: No validation folder found.", flush=True)
+            emit_text("Warning: No validation folder found.")
             dataloaders['val'] = None
             dataset_sizes['val'] = 0
             
         # Test
         if os.path.isdir(test_dir):
-            test_dataset = FilteredImageFolder(test_dir, data_transforms['val'])
+            test_dataset = open_image_folder(test_dir, data_transforms['val'], image_loaders['val'], manifest, quarantined)
             dataloaders['test'] = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
             dataset_sizes['test'] = len(test_dataset)
         else:
@@ -162,61 +256,38 @@ def main():
             dataset_sizes['test'] = 0
             
     else:
-        print("Detected flat dataset. Performing auto-split (Train=80%, Val=10%, Test=10%).", flush=True)
+        emit_text("Detected flat dataset. Performing auto-split (Train=80%, Val=10%, Test=10%).")
         
         # 1. Check valid structure (subfolders)
-        if not any(os.path.isdir(os.path.join(data_dir, i)) for i in os.listdir(data_dir)):
-            print(json.dumps({
+        if not is_packed_dataset(data_dir) and not any(os.path.isdir(os.path.join(data_dir, i)) for i in os.listdir(data_dir)):
+            emit({
                 "status": "error", 
                 "message": "Invalid dataset structure. Expected folders for each class."
-            }), flush=True)
+            })
             return
 
         # 2. Determine split indices
         # We load a dummy dataset just to get lengths and targets
-        dummy_dataset = FilteredImageFolder(data_dir)
+        dummy_dataset = open_image_folder(data_dir, manifest=manifest, exclude=quarantined)
         class_names = dummy_dataset.classes
         total_images = len(dummy_dataset)
         
         if total_images == 0:
-            print(json.dumps({"status": "error", "message": "No images found."}), flush=True)
+            emit({"status": "error", "message": "No images found."})
             return
             
-        train_len = int(0.8 * total_images)
-        val_len = int(0.1 * total_images)
-        test_len = total_images - train_len - val_len
-        
-        # 3. Create datasets with correct transforms
-        # We use train_test_split to get stratified indices
-        from sklearn.model_selection import train_test_split
-        
-        targets = dummy_dataset.targets
-        indices = list(range(total_images))
-        
-        try:
-            train_idx, temp_idx, _, temp_targets = train_test_split(
-                indices, targets, train_size=train_len, stratify=targets, random_state=42
-            )
-            val_idx, test_idx = train_test_split(
-                temp_idx, train_size=val_len, stratify=temp_targets, random_state=42
-            )
-        except ValueError as e:
-            print(f"Stratification failed ({e}), falling back to random split.", flush=True)
-            from torch.utils.data import random_split
-            subset_train, subset_val, subset_test = random_split(dummy_dataset, [train_len, val_len, test_len])
-            train_idx = subset_train.indices
-            val_idx = subset_val.indices
-            test_idx = subset_test.indices
-        
+        # 3. Stratified indices (the same split export_model.py uses)
+        train_idx, val_idx, test_idx = split_indices(dummy_dataset.targets)
+
         # True datasets
-        dataset_train_full = FilteredImageFolder(data_dir, data_transforms['train'])
-        dataset_eval_full = FilteredImageFolder(data_dir, data_transforms['val'])
+        dataset_train_full = open_image_folder(data_dir, data_transforms['train'], image_loaders['train'], manifest, quarantined)
+        dataset_eval_full = open_image_folder(data_dir, data_transforms['val'], image_loaders['val'], manifest, quarantined)
         
         train_dataset = Subset(dataset_train_full, train_idx)
         val_dataset = Subset(dataset_eval_full, val_idx)
         test_dataset = Subset(dataset_eval_full, test_idx)
         
-        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+        dataloaders['train'] = DataLoader(train_dataset, batch_size=batch_size, num_workers=num_workers, **train_sampling(train_dataset))
         dataloaders['val'] = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
         dataloaders['test'] = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
         
@@ -224,13 +295,60 @@ def main():
         dataset_sizes['val'] = len(val_dataset)
         dataset_sizes['test'] = len(test_dataset)
 
-    print(f"Classes: {class_names}", flush=True)
-    print(f"Split sizes: Train={dataset_sizes.get('train',0)}, Val={dataset_sizes.get('val',0)}, Test={dataset_sizes.get('test',0)}", flush=True)
+    emit_text(f"Classes: {class_names}")
+    emit_text(f"Split sizes: Train={dataset_sizes.get('train',0)}, Val={dataset_sizes.get('val',0)}, Test={dataset_sizes.get('test',0)}")
+
+    # --- Decode backend savings estimate ---
+    if image_loaders['train'] is not None and dataset_sizes['train'] > 0:
+        from image_decode import estimate_epoch_savings
+        from image_datasets import sample_bytes
+        bench = estimate_epoch_savings(sample_bytes(dataloaders['train'].dataset), image_loaders['train'], dataset_sizes['train'])
+        emit({"status": "decode_benchmark", "backend": args.decode_backend, **bench})
+
+    # --- DataLoader autotuning (Optional) ---
+    if args.autotune_loader and dataset_sizes['train'] > 0:
+        import loader_tuner
+        emit_text("Autotuning data loader configuration...")
+        with main_first():
+            loader_config = loader_tuner.autotune(dataloaders['train'].dataset, batch_size, save_dir)
+        num_workers = loader_config['num_workers']
+        for phase, loader in dataloaders.items():
+            if loader is not None:
+                dataloaders[phase] = loader_tuner.rebuild_loader(loader, loader_config)
+
+    # --- Decoded val/test cache (Optional; the feature cache supersedes it) ---
+    if args.cache_eval_images and not args.feature_cache:
+        import tensor_cache
+        decoded_cache_root = os.path.join(save_dir, 'decoded_cache')
+        for phase in ('val', 'test'):
+            if dataloaders.get(phase) is not None and dataset_sizes[phase] > 0:
+                emit_text(f"Preparing decoded image cache for {phase} split...")
+                with main_first():
+                    dataloaders[phase] = tensor_cache.cached_eval_loader(
+                        dataloaders[phase].dataset, image_size, None if batch_pipeline else normalize,
+                        decoded_cache_root, batch_size, num_workers
+                    )
+
+    # --- Shard train/val across ranks (test runs on rank 0 after training) ---
+    if dist_ctx is not None:
+        if dataset_sizes['train'] > 0:
+            dataloaders['train'] = dist_ctx.shard_train_loader(dataloaders['train'])
+        if dataloaders.get('val') is not None and dataset_sizes['val'] > 0:
+            dataloaders['val'] = dist_ctx.shard_eval_loader(dataloaders['val'])
+
+    # --- CPU plan: intra-op threads vs loader workers (within this rank's cores) ---
+    if args.cpu_plan != 'off':
+        cpu_plan = make_plan(args.cpu_plan, num_workers)
+        apply_plan(cpu_plan)
+        for phase, loader in dataloaders.items():
+            if loader is not None:
+                dataloaders[phase] = pin_loader(loader, cpu_plan)
+        emit(cpu_plan.report())
 
     # --- Zip Dataset (Optional) ---
-    if args.zip_dataset or args.only_zip:
+    if (args.zip_dataset or args.only_zip) and is_main_process:
         import zipfile
-        print("Creating dataset zip archive...", flush=True)
+        emit_text("Creating dataset zip archive...")
         zip_path = os.path.join(save_dir, 'dataset.zip')
         
         try:
@@ -261,33 +379,147 @@ def main():
                             # We stick to phase/class/filename. If source had duplicates, they overwrite or error? 
                             # ZipFile allows duplicates.
                             arcname = f"{phase}/{class_name}/{filename}"
-                            zf.write(img_path, arcname)
+                            if hasattr(source_dataset, 'read_bytes'):
+                                # Packed datasets have no files on disk to copy
+                                zf.writestr(arcname, source_dataset.read_bytes(idx))
+                            else:
+                                zf.write(img_path, arcname)
             
-            print(json.dumps({
+            emit({
                 "status": "dataset_zip",
                 "message": "Dataset Zip Created",
                 "path": zip_path
-            }), flush=True)
+            })
             
         except Exception as e:
-            print(f"Warning: Failed to create zip: {e}", flush=True)
+            emit_text(f"Warning: Failed to create zip: {e}")
             
         if args.only_zip:
-            print("Export complete. Exiting.", flush=True)
+            emit_text("Export complete. Exiting.")
             return
 
     # Setup Model
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}", flush=True)
+    device = torch.device("cuda:0" if torch.cuda.is_available() and dist_ctx is None else "cpu")
+    emit_text(f"Using device: {device}")
+    if dist_ctx is not None:
+        emit_text(f"Distributed data parallel: {dist_ctx.world_size} ranks (gloo), {torch.get_num_threads()} threads per rank")
     
     import model_factory
     
     try:
-        model, parameters_to_optimize = model_factory.create_model(args.model, len(class_names), device)
+        if args.model_cache:
+            import model_cache
+            # Rank 0 builds and saves a missing entry; the other ranks then load it
+            with main_first():
+                model, parameters_to_optimize = model_cache.create_model(
+                    args.model, len(class_names), device, os.path.join(save_dir, 'model_cache'), keep_in_memory=False
+                )
+        else:
+            model, parameters_to_optimize = model_factory.create_model(args.model, len(class_names), device)
     except ValueError as e:
-        print(json.dumps({"status": "error", "message": str(e)}), flush=True)
+        emit({"status": "error", "message": str(e)})
         return
 
+    # `net` is what the loops run; it is the head alone when training from cached features
+    net = model
+    using_feature_cache = False
+    if args.feature_cache and dist_ctx is not None:
+        emit({"status": "info", "message": "Feature cache is not used in distributed mode. Training normally."})
+    elif args.feature_cache:
+        import feature_cache
+        from image_datasets import with_transform
+
+        if feature_cache.supports_feature_cache(args.model):
+            cache_root = os.path.join(save_dir, 'feature_cache')
+            feature_sets = {
+                phase: with_transform(loader.dataset, val_transform) if loader is not None else None
+                for phase, loader in dataloaders.items()
+            }
+            dataloaders = feature_cache.build_feature_loaders(
+                model, args.model, feature_sets, cache_root, device, batch_size, num_workers
+            )
+            net = model_factory.get_head(model, args.model)
+            using_feature_cache = True
+            batch_pipeline = None  # loaders now yield features, not images
+            emit_text("Training classifier head on cached features.")
+        else:
+            emit({
+                "status": "info",
+                "message": f"Feature cache is not available for {args.model} (backbone is trainable). Training normally."
+            })
+
+    # --- Precision / memory layout ---
+    # The fp32 baseline is measured once on a copy of the model, so epoch events can report the gain
+    precision_mode = args.precision
+    channels_last = args.channels_last
+    precision_report = None
+    if (precision_mode != 'fp32' or channels_last) and dataset_sizes['train'] > 0 and not args.evaluate_only:
+        from precision import benchmark
+        try:
+            sample_inputs, sample_labels = next(iter(dataloaders['train']))
+            sample_inputs, sample_labels = sample_inputs.to(device), sample_labels.to(device)
+            if batch_pipeline is not None:
+                sample_inputs = batch_pipeline(sample_inputs, train=True)
+            precision_report = benchmark(net, nn.CrossEntropyLoss(), sample_inputs, sample_labels, device, precision_mode, channels_last)
+            emit({"status": "precision_benchmark", **precision_report})
+        except Exception as e:
+            emit({
+                "status": "info",
+                "message": f"{precision_mode}/channels_last={channels_last} is not supported for {args.model} on {device} ({e}). Training in fp32."
+            })
+            precision_mode, channels_last = 'fp32', False
+    prepare_model(net, channels_last)
+
+    # The test phase runs on rank 0 alone, outside the process group
+    test_net = net
+    if dist_ctx is not None:
+        from torch.nn.parallel import DistributedDataParallel
+        net = DistributedDataParallel(net)
+
+    # --- torch.compile (the first step of each phase compiles; kernels are cached on disk) ---
+    step_timers = None
+    if args.compile:
+        import compile_cache
+        input_shape = (batch_size, 'features') if using_feature_cache else (batch_size, 3, image_size, image_size)
+        compile_dir = compile_cache.compile_cache_dir(
+            save_dir, args.model, len(class_names), input_shape,
+            precision=precision_mode, channels_last=channels_last, device=device.type
+        )
+        compile_warm = compile_cache.enable_compile_cache(compile_dir)
+        net = compile_cache.compile_model(net)
+        if dist_ctx is None:
+            test_net = net
+        step_timers = {'train': compile_cache.StepTimer(), 'val': compile_cache.StepTimer()}
+        emit_text(f"Compiling model ({'warm' if compile_warm else 'cold'} cache: {compile_dir})")
+
+    # --- Progressive resizing: only the train loader changes resolution ---
+    resize_schedule = None
+    train_resolution = image_size
+    if args.progressive_resize and dataset_sizes['train'] > 0:
+        import progressive_resize
+        if using_feature_cache:
+            emit({"status": "info", "message": "Progressive resizing is not used with the feature cache."})
+        elif args.model in progressive_resize.FIXED_RESOLUTION_MODELS:
+            emit({"status": "info", "message": f"{args.model} requires {image_size}px inputs; progressive resizing disabled."})
+        else:
+            from image_datasets import with_dataset, with_transform
+            resize_schedule = progressive_resize.epoch_resolutions(
+                args.epochs, progressive_resize.parse_sizes(args.progressive_resize, image_size)
+            )
+            base_train_loader = dataloaders['train']
+
+            def train_loader_at(size):
+                if size == image_size:
+                    return base_train_loader
+                if batch_pipeline is not None:
+                    transform = build_uint8_transform(size)
+                else:
+                    transform = transforms.Compose([build_transforms(aug_config, image_size=size)[0], normalize])
+                decoder = make_loader(args.decode_backend, train_decode_size * size // image_size)
+                return with_dataset(base_train_loader, with_transform(base_train_loader.dataset, transform, decoder))
+
+            emit({"status": "info", "message": f"Progressive resizing schedule: {resize_schedule}"})
+
     try:
         criterion = nn.CrossEntropyLoss()
         optimizer = optim.SGD(parameters_to_optimize, lr=args.learning_rate, momentum=0.9)
@@ -298,157 +530,237 @@ def main():
 
         # --- Checkpoint Resume ---
         if args.resume and os.path.isfile(args.resume):
-            print(f"Resuming from checkpoint: {args.resume}", flush=True)
-            checkpoint = torch.load(args.resume, map_location=device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-                optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-                start_epoch = checkpoint['epoch'] + 1
-                best_acc = checkpoint.get('best_acc', 0.0)
-                print(json.dumps({
+            emit_text(f"Resuming from checkpoint: {args.resume}")
+            load_start = time.time()
+            resume_epoch, resume_best_acc = load_checkpoint(args.resume, model, device, optimizer)
+            emit_text(f"Checkpoint loaded in {time.time() - load_start:.2f}s")
+            if resume_epoch is not None:
+                start_epoch = resume_epoch + 1
+                best_acc = resume_best_acc
+                emit({
                     "status": "resumed",
                     "message": f"Resumed from epoch {start_epoch}",
                     "best_acc": f"{best_acc:.4f}"
-                }), flush=True)
+                })
             else:
-                model.load_state_dict(checkpoint)
                 start_epoch = 0
                 best_acc = 0.0
-                print(json.dumps({
+                emit({
                     "status": "resumed",
                     "message": f"Loaded model weights only",
                     "best_acc": f"{best_acc:.4f}"
-                }), flush=True)
+                })
         elif args.resume:
-            print(f"Warning: Checkpoint file not found at '{args.resume}', starting from scratch.", flush=True)
+            emit_text(f"Warning: Checkpoint file not found at '{args.resume}', starting from scratch.")
 
         if args.evaluate_only:
-            print("Evaluate only mode. Skipping training loop.", flush=True)
+            emit_text("Evaluate only mode. Skipping training loop.")
             start_epoch = num_epochs # skip loop
 
-        # --- Early Stopping State ---
-        best_val_loss = float('inf')
-        epochs_no_improve = 0
-        patience = args.patience
+        # Checkpoints are snapshotted to CPU and written by a background thread
+        from checkpoint_writer import CheckpointWriter
+        checkpoint_writer = CheckpointWriter(save_dir, keep_last=args.keep_checkpoints) if is_main_process else None
 
-        print("Starting training loop...", flush=True)
+        # --- Early Stopping / Validation Schedule ---
+        patience = args.patience
+        val_schedule = ValidationSchedule(
+            num_epochs, start_epoch, every=args.val_every, subsample=args.val_subsample, patience=patience
+        )
+        val_loaders = {FULL: dataloaders.get('val')}
+        if args.val_subsample and dataset_sizes['val'] > 0:
+            subset_indices = stratified_subsample(loader_labels(dataloaders['val']), args.val_subsample)
+            val_loaders[SUBSET] = subset_loader(dataloaders['val'], subset_indices)
+            emit_text(f"Early validations use a stratified subsample of {len(subset_indices)}/{dataset_sizes['val']} images.")
+
+        val_acc_epoch = 0.0
+        val_loss_epoch = 0.0
+        val_per_class = None
+
+        emit_text("Starting training loop...")
+
+        step_profiler = StepProfiler(device, exact=args.exact_step_timing)
+        trace_window = None
+        if args.trace_steps > 0 and is_main_process:
+            trace_window = TraceWindow(os.path.join(save_dir, 'traces'), args.trace_steps, args.trace_skip, device)
 
         for epoch in range(start_epoch, num_epochs):
+            if resize_schedule is not None and resize_schedule[epoch] != train_resolution:
+                train_resolution = resize_schedule[epoch]
+                dataloaders['train'] = train_loader_at(train_resolution)
+                emit({"status": "resolution_change", "epoch": epoch + 1, "resolution": train_resolution})
+            if dist_ctx is not None:
+                dist_ctx.set_epoch(dataloaders['train'], epoch)
             train_acc_epoch = 0.0
             train_loss_epoch = 0.0
-            val_acc_epoch = 0.0
-            val_loss_epoch = 0.0
+            train_images_per_sec = 0.0
+            train_step_ms = 0.0
+            val_kind = val_schedule.plan(epoch) if dataset_sizes['val'] > 0 else None
+            stop_early = False
             for phase in ['train', 'val']:
                 if dataset_sizes[phase] == 0:
                     continue # Skip empty phase
+                if phase == 'val' and val_kind is None:
+                    continue # Not scheduled this epoch
 
                 if phase == 'train':
-                    model.train()
+                    net.train()
+                    loader = dataloaders['train']
                 else:
-                    model.eval()
-
-                running_loss = 0.0
-                running_corrects = 0
-
-                for inputs, labels in dataloaders[phase]:
-                    inputs = inputs.to(device)
-                    labels = labels.to(device)
+                    net.eval()
+                    loader = val_loaders[val_kind]
+
+                # Loss/confusion tallies stay on the device; read back once per phase
+                phase_metrics = EpochMetrics(len(class_names))
+                phase_start = time.time()
+                steps = 0
+                step_profiler.reset()
+
+                for inputs, labels in loader:
+                    step_profiler.lap('data')
+                    inputs = inputs.to(device, non_blocking=True)
+                    labels = labels.to(device, non_blocking=True)
+                    if batch_pipeline is not None:
+                        step_profiler.lap('transfer')
+                        inputs = batch_pipeline(inputs, train=(phase == 'train'))
+                        step_profiler.lap('augment')
+                    inputs = prepare_inputs(inputs, channels_last)
+                    step_profiler.lap('transfer')
+                    step_start = time.time()
 
                     optimizer.zero_grad()
+                    step_profiler.lap('optimizer')
 
                     with torch.set_grad_enabled(phase == 'train'):
-                        outputs = model(inputs)
-                        _, preds = torch.max(outputs, 1)
-                        loss = criterion(outputs, labels)
+                        with autocast(device, precision_mode):
+                            outputs = net(inputs)
+                            step_profiler.lap('forward')
+                            loss = criterion(outputs, labels)
+                            step_profiler.lap('loss')
 
                         if phase == 'train':
                             loss.backward()
+                            step_profiler.lap('backward')
                             optimizer.step()
-
-                    running_loss += loss.item() * inputs.size(0)
-                    running_corrects += torch.sum(preds == labels.data)
-                
-                epoch_loss = running_loss / dataset_sizes[phase]
-                epoch_acc = running_corrects.double() / dataset_sizes[phase]
+                            step_profiler.lap('optimizer')
+
+                    phase_metrics.update(loss, outputs, labels)
+                    steps += 1
+                    if step_timers is not None and epoch == start_epoch:
+                        # Only the compile-timing epoch waits for each step to finish
+                        if device.type == 'cuda':
+                            torch.cuda.synchronize()
+                        step_timers[phase].record(time.time() - step_start, tuple(inputs.shape))
+                    step_profiler.lap('metrics')
+                    step_profiler.step_done(labels.shape[0])
+                    if phase == 'train' and trace_window is not None:
+                        trace_window.step()
+                step_report = step_profiler.report(epoch + 1, phase)
+                if phase == 'val':
+                    step_report["validation"] = val_kind
+                emit(step_report)
+
+                if dist_ctx is not None:
+                    phase_metrics.all_reduce()
+                phase_result = phase_metrics.compute(class_names if phase == 'val' else None)
+                epoch_loss = phase_result["loss"]
+                epoch_acc = phase_result["accuracy"]
                 if phase == 'train':
                     train_loss_epoch = epoch_loss
-                    train_acc_epoch = epoch_acc.item()
+                    train_acc_epoch = epoch_acc
+                    phase_seconds = max(time.time() - phase_start, 1e-9)
+                    train_images_per_sec = dataset_sizes[phase] / phase_seconds
+                    train_step_ms = phase_seconds * 1000 / max(steps, 1)
 
                 elif phase == 'val':
                     val_loss_epoch = epoch_loss
-                    val_acc_epoch = epoch_acc.item()
-                
-                if phase == 'val':
-                    # --- Save best model when accuracy improves ---
-                    if epoch_acc > best_acc:
+                    val_acc_epoch = epoch_acc
+                    val_per_class = phase_result["per_class"]
+
+                    # --- Save best model when accuracy improves (full validations only) ---
+                    if val_kind == FULL and epoch_acc > best_acc:
                         best_acc = epoch_acc
                         best_model_path = os.path.join(save_dir, 'best_model.pth')
-                        torch.save(model.state_dict(), best_model_path)
-                        print(json.dumps({
+                        if checkpoint_writer is not None:
+                            checkpoint_writer.save(model_payload(model, args.checkpoint_format), best_model_path)
+                        emit({
                             "status": "checkpoint",
                             "message": f"New Best Model! Acc: {epoch_acc:.4f}",
                             "path": best_model_path
-                        }), flush=True)
-
-                    # --- Full checkpoint (always, for resume support) ---
-                    checkpoint_path = os.path.join(save_dir, 'checkpoint.pth')
-                    torch.save({
-                        'epoch': epoch,
-                        'model_state_dict': model.state_dict(),
-                        'optimizer_state_dict': optimizer.state_dict(),
-                        'best_acc': float(best_acc),
-                    }, checkpoint_path)
-
-                    # --- Early Stopping: track best val loss ---
-                    if epoch_loss < best_val_loss:
-                        best_val_loss = epoch_loss
-                        epochs_no_improve = 0
-                    else:
-                        epochs_no_improve += 1
-
-                    status_update = {
+                        })
+
+                    # --- Early Stopping: patience counts epochs since the last improvement ---
+                    stop_early = val_schedule.record(epoch, val_kind, epoch_loss)
+
+            if step_timers is not None and epoch == start_epoch:
+                emit(compile_cache.compile_report(step_timers, compile_dir, compile_warm))
+
+            # --- Full checkpoint (always, for resume support) ---
+            if checkpoint_writer is not None:
+                checkpoint_writer.save_rotating(
+                    training_payload(model, optimizer, epoch, best_acc, args.checkpoint_format), epoch
+                )
+
+            # Val fields repeat the latest validation when this epoch skipped it
+            status_update = {
+            "epoch": epoch + 1,
+            "total_epochs": num_epochs,
+            "train_accuracy": f"{train_acc_epoch:.4f}",
+            "train_loss": f"{train_loss_epoch:.4f}",
+            "val_accuracy": f"{val_acc_epoch:.4f}",
+            "val_loss": f"{val_loss_epoch:.4f}",
+            "validation": val_kind or "skipped",
+            "resolution": train_resolution,
+            "images_per_sec": round(train_images_per_sec, 1),
+            "step_ms": round(train_step_ms, 2),
+            "val_per_class": val_per_class,
+            "status": "training"
+            }
+            if precision_report is not None:
+                # fp32 throughput estimated from the measured compute speedup
+                speedup = precision_report["speedup_vs_fp32"]
+                status_update["precision"] = precision_mode
+                status_update["channels_last"] = channels_last
+                status_update["speedup_vs_fp32"] = speedup
+                status_update["images_per_sec_gained_vs_fp32"] = round(train_images_per_sec * (1 - 1 / speedup), 1)
+            emit(status_update)
+
+            # --- Trigger early stop ---
+            if stop_early:
+                emit({
+                    "status": "stopped_early",
                     "epoch": epoch + 1,
-                    "total_epochs": num_epochs,
-                    "train_accuracy": f"{train_acc_epoch:.4f}",
-                    "train_loss": f"{train_loss_epoch:.4f}",
-                    "val_accuracy": f"{val_acc_epoch:.4f}",
-                    "val_loss": f"{val_loss_epoch:.4f}",
-                    "status": "training"
-                    }
-                    print(json.dumps(status_update), flush=True)
-
-                    # --- Trigger early stop ---
-                    if epochs_no_improve >= patience:
-                        print(json.dumps({
-                            "status": "stopped_early",
-                            "epoch": epoch + 1,
-                            "message": f"No val loss improvement for {patience} epochs. Stopping early."
-                        }), flush=True)
-                        break
-
-            else:
-                continue
-            break
-
-        print("Training Complete!", flush=True)
+                    "message": f"No val loss improvement for {patience} epochs. Stopping early."
+                })
+                break
+
+        if trace_window is not None:
+            trace_window.close()
+        if checkpoint_writer is not None:
+            checkpoint_writer.close()
+        if dist_ctx is not None:
+            dist_ctx.shutdown()
+            if not dist_ctx.is_main:
+                return
+        emit_text("Training Complete!")
         
         # --- TEST / EVALUATION PHASE ---
         if dataloaders.get('test') and dataset_sizes['test'] > 0:
-            print("Starting Evaluation on Test Set...", flush=True)
+            emit_text("Starting Evaluation on Test Set...")
             
             if not args.evaluate_only:
                 # Load best weights
                 best_model_path = os.path.join(save_dir, 'best_model.pth')
                 if os.path.exists(best_model_path):
-                    model.load_state_dict(torch.load(best_model_path))
-                    print("Loaded best model weights.", flush=True)
+                    load_checkpoint(best_model_path, model, device)
+                    emit_text("Loaded best model weights.")
                 else:
-                    print("Warning: Best model not found, using last epoch weights.", flush=True)
+                    emit_text("Warning: Best model not found, using last epoch weights.")
             else:
-                print("Using currently loaded weights for evaluation.", flush=True)
+                emit_text("Using currently loaded weights for evaluation.")
                 
-            model.eval()
+            test_net.eval()
             
+            # Predictions stay on the device and are copied back once
             all_preds = []
             all_labels = []
             
@@ -456,21 +768,33 @@ def main():
                 for inputs, labels in dataloaders['test']:
                     inputs = inputs.to(device)
                     labels = labels.to(device)
+                    if batch_pipeline is not None:
+                        inputs = batch_pipeline(inputs, train=False)
+                    inputs = prepare_inputs(inputs, channels_last)
                     
-                    outputs = model(inputs)
-                    _, preds = torch.max(outputs, 1)
+                    with autocast(device, precision_mode):
+                        outputs = test_net(inputs)
                     
-                    all_preds.extend(preds.cpu().numpy())
-                    all_labels.extend(labels.cpu().numpy())
+                    all_preds.append(outputs.argmax(dim=1))
+                    all_labels.append(labels)
+
+            all_preds = torch.cat(all_preds).cpu().numpy()
+            all_labels = torch.cat(all_labels).cpu().numpy()
             
             # Generate Reports
-            print("\n" + "="*30, flush=True)
-            print("GENERATING RESULTS...", flush=True)
-            print("="*30, flush=True)
+            emit_text("\n" + "="*30)
+            emit_text("GENERATING RESULTS...")
+            emit_text("="*30)
             
+            from sklearn.metrics import classification_report, confusion_matrix
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+
             # 1. Classification Report (Dict for UI, Text for Logs)
             cr_text = classification_report(all_labels, all_preds, target_names=class_names, labels=range(len(class_names)), zero_division=0)
-            print(cr_text, flush=True)
+            emit_text(cr_text)
             
             cr_dict = classification_report(all_labels, all_preds, target_names=class_names, labels=range(len(class_names)), zero_division=0, output_dict=True)
             
@@ -488,7 +812,7 @@ def main():
             cm_save_path = os.path.join(save_dir, 'confusion_matrix.png')
             plt.savefig(cm_save_path)
             plt.close()
-            print(f"Confusion Matrix saved to: {cm_save_path}", flush=True)
+            emit_text(f"Confusion Matrix saved to: {cm_save_path}")
             
             # Send Data to Frontend
             eval_result = {
@@ -498,7 +822,7 @@ def main():
                 "total_epochs": num_epochs,
                 "test_size": dataset_sizes['test']
             }
-            print(json.dumps(eval_result), flush=True)
+            emit(eval_result)
                     # ===============================
         # SAVE EXPERIMENT SUMMARY (RUNS)
         # ===============================
@@ -532,31 +856,27 @@ def main():
                     with open(summary_path, "w") as f:
                        json.dump(summary, f, indent=2)
 
-                    print(json.dumps({
+                    emit({
                         "status": "run_saved",
                         "path": summary_path
-                    }), flush=True)
+                    })
 
             except Exception as e:
-                print(json.dumps({
+                emit({
                     "status": "error",
                     "message": f"Failed to save run summary: {str(e)}"
-                }), flush=True)
+                })
     except Exception as e:
         # Catch and print any error clearly
         error_msg = {"status": "error", "message": f"Exception: {str(e)}"}
-        print(json.dumps(error_msg), flush=True)
+        emit(error_msg)
         # Also print to stderr for logs
         sys.stderr.write(f"Detailed Error: {str(e)}\n")
         import traceback
         traceback.print_exc()
+        if dist_ctx is not None:
+            # Peers would block in collectives; a non-zero exit makes the launcher stop them
+            sys.exit(1)
     
 if __name__ == "__main__":
-    _install_missing("torch")
-    _install_missing("torchvision")
-    _install_missing("numpy")
-    _install_missing("sklearn", "scikit-learn")
-    _install_missing("pandas")
-    _install_missing("matplotlib")
-    _install_missing("seaborn")
     main()
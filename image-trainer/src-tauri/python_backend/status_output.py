@@ -0,0 +1,28 @@
+"""
+Line-atomic stdout for the JSON-lines status protocol.
+
+The frontend parses stdout one line at a time. Background threads (the
+resource monitor, the checkpoint writer, inference server handlers) write
+alongside the main loop, and print() writes the text and the newline as
+separate calls, so unsynchronised lines can interleave. Every status line
+goes through emit() or emit_text(), which write one whole line per call
+under a shared lock.
+"""
+import sys
+import json
+import threading
+
+_lock = threading.Lock()
+
+
+def emit_text(text):
+    """Writes `text` plus a newline as a single write, then flushes."""
+    line = f"{text}\n"
+    with _lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def emit(obj):
+    """Writes `obj` as one JSON line for the frontend."""
+    emit_text(json.dumps(obj))
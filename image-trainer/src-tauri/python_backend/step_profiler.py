@@ -0,0 +1,114 @@
+"""
+Where the time in a training/validation step goes.
+
+StepProfiler splits every step of the loop into consecutive phases, each
+timed from the end of the previous one:
+
+  data       Waiting for the DataLoader to yield the batch
+  transfer   Host-to-device copy (and the channels_last conversion)
+  augment    Batched augmentation (--batch_augment only)
+  forward    Model forward pass
+  loss       Criterion
+  backward   loss.backward() (includes the gradient all-reduce under DDP)
+  optimizer  zero_grad + optimizer.step()
+  metrics    On-device metric tallies
+
+and emits one step_profile event per epoch and phase. On CUDA the
+kernels run asynchronously, so time lands wherever the host next waits;
+exact=True synchronizes at every boundary instead, which is accurate but
+slows training down.
+
+TraceWindow records a torch.profiler trace for a window of training steps
+and writes it as a Chrome trace (chrome://tracing, Perfetto).
+"""
+import os
+import time
+
+import torch
+
+from status_output import emit, emit_text
+
+PHASES = ('data', 'transfer', 'augment', 'forward', 'loss', 'backward', 'optimizer', 'metrics')
+
+
+class StepProfiler:
+    def __init__(self, device, exact=False):
+        self.sync = exact and device.type == 'cuda'
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.steps = 0
+        self.images = 0
+        self.started = time.perf_counter()
+        self.mark = self.started
+
+    def lap(self, phase):
+        if self.sync:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.totals[phase] += now - self.mark
+        self.mark = now
+
+    def step_done(self, batch_size):
+        self.steps += 1
+        self.images += batch_size
+
+    def report(self, epoch, phase):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        steps = max(self.steps, 1)
+        timed = sum(self.totals.values())
+        return {
+            "status": "step_profile",
+            "epoch": epoch,
+            "phase": phase,
+            "steps": self.steps,
+            "images_per_sec": round(self.images / elapsed, 1),
+            "ms_per_step": {name: round(seconds * 1000 / steps, 3) for name, seconds in self.totals.items() if seconds},
+            "percent": {name: round(100 * seconds / timed, 1) for name, seconds in self.totals.items() if seconds} if timed else {},
+        }
+
+
+class TraceWindow:
+    """Profiles training steps [skip, skip + steps) with torch.profiler, then stops."""
+
+    def __init__(self, trace_dir, steps, skip=0, device=None):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.path = os.path.join(trace_dir, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if device is not None and device.type == 'cuda':
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        # One warmup step before the window, which the profiler discards
+        skip_first = max(skip - 1, 0)
+        self.remaining = skip_first + 1 + steps
+        self.profiler = torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(skip_first=skip_first, wait=0, warmup=1, active=steps, repeat=1),
+            on_trace_ready=self._save,
+            record_shapes=True,
+        )
+        self.profiler.start()
+
+    def _save(self, profiler):
+        profiler.export_chrome_trace(self.path)
+        top = profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=10)
+        emit_text(top)
+        emit({"status": "profiler_trace", "path": self.path})
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def step(self):
+        if not self.active:
+            return
+        self.profiler.step()
+        self.remaining -= 1
+        if not self.active:
+            self.profiler.stop()
+
+    def close(self):
+        """Stops early (e.g. training ended inside the window); the partial trace is still written."""
+        if self.active:
+            self.remaining = 0
+            self.profiler.stop()
@@ -44,8 +44,8 @@ def get_system_info():
         }
     }
 
-    print(json.dumps(info))
+    return info
 
 
 if __name__ == "__main__":
-    get_system_info()
\ No newline at end of file
+    print(json.dumps(get_system_info()))
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Decoded-image cache for the deterministic val/test transform.
+
+The evaluation transform is Resize -> ToTensor -> Normalize, so the resized
+uint8 pixels of a val/test image never change between epochs or runs. This
+module decodes each split once into a memory-mapped (N, 3, H, W) uint8 array
+and serves normalized float batches straight from it.
+"""
+import os
+import json
+import time
+
+import numpy as np
+from torch.utils.data import DataLoader
+from torchvision import transforms
+
+from image_datasets import MemmapLoader, dataset_decoder, dataset_fingerprint, with_transform
+from status_output import emit
+
+CACHE_VERSION = 1
+
+
+def _decode_to_cache(dataset, image_size, cache_dir, batch_size, num_workers):
+    """Decodes every image of the dataset into images.npy / labels.npy."""
+    decode = transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.PILToTensor(),
+    ])
+    loader = DataLoader(with_transform(dataset, decode), batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+    images_tmp = os.path.join(cache_dir, 'images.tmp.npy')
+    images = np.lib.format.open_memmap(
+        images_tmp, mode='w+', dtype=np.uint8, shape=(len(dataset), 3, image_size, image_size)
+    )
+    labels = np.empty(len(dataset), dtype=np.int64)
+    offset = 0
+    for inputs, targets in loader:
+        images[offset:offset + len(inputs)] = inputs.numpy()
+        labels[offset:offset + len(inputs)] = targets.numpy()
+        offset += len(inputs)
+
+    images.flush()
+    del images
+    os.replace(images_tmp, os.path.join(cache_dir, 'images.npy'))
+    np.save(os.path.join(cache_dir, 'labels.npy'), labels)
+
+
+def cached_eval_loader(dataset, image_size, normalize, cache_root, batch_size, num_workers=0):
+    """
+    Returns a MemmapLoader over the decoded cache of `dataset`, building it
+    on a miss. The cache is keyed by the dataset's file list (paths, sizes,
+    mtimes), the image size and the decoder, so changing any of them
+    invalidates it. Batches
+    are normalized floats, or raw uint8 when `normalize` is None.
+    """
+    key = dataset_fingerprint(dataset, extra={
+        "version": CACHE_VERSION,
+        "image_size": image_size,
+        "decoder": dataset_decoder(dataset),
+    })
+    cache_dir = os.path.join(cache_root, key)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    hit = os.path.exists(meta_path)
+    start = time.time()
+
+    if not hit:
+        os.makedirs(cache_dir, exist_ok=True)
+        _decode_to_cache(dataset, image_size, cache_dir, batch_size, num_workers)
+        # meta.json is written last and marks the cache as complete
+        with open(meta_path, 'w') as f:
+            json.dump({"samples": len(dataset), "image_size": image_size, "version": CACHE_VERSION}, f)
+
+    # Copy-on-write mapping: batches are zero-copy views that torch can wrap
+    images = np.load(os.path.join(cache_dir, 'images.npy'), mmap_mode='c')
+    labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+    emit({
+        "status": "decoded_cache",
+        "cached": hit,
+        "samples": int(len(labels)),
+        "image_size": image_size,
+        "seconds": round(time.time() - start, 2),
+        "path": cache_dir,
+    })
+
+    def to_float(batch):
+        return normalize(batch.float().div_(255))
+
+    return MemmapLoader(images, labels, batch_size, shuffle=False, transform=to_float if normalize else None)
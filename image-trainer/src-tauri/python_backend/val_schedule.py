@@ -0,0 +1,74 @@
+"""
+Validation scheduling for the training loop.
+
+Validation can run every N epochs and, in early epochs, on a fixed
+stratified subsample of the validation split. The full split is always used
+for the final epochs and whenever early stopping could trigger, so the best
+model and the stop decision are based on full validations. Subsample and
+full losses are not comparable, so each kind keeps its own best loss; the
+first full validation only sets the full baseline, so the run stops only
+after a full validation fails to beat an earlier one. Patience grows by the
+number of epochs since the previous validation.
+"""
+import math
+
+import numpy as np
+
+FULL = 'full'
+SUBSET = 'subset'
+
+
+def stratified_subsample(labels, fraction, seed=42):
+    """Sorted positions of a fixed per-class sample (at least one per class)."""
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    picked = []
+    for label in np.unique(labels):
+        positions = np.flatnonzero(labels == label)
+        count = max(1, int(round(len(positions) * fraction)))
+        picked.append(rng.choice(positions, size=min(count, len(positions)), replace=False))
+    return np.sort(np.concatenate(picked)) if picked else np.array([], dtype=np.int64)
+
+
+class ValidationSchedule:
+    def __init__(self, num_epochs, start_epoch=0, every=1, subsample=0.0, patience=5):
+        self.num_epochs = num_epochs
+        self.every = max(1, every)
+        self.subsample = subsample
+        self.patience = patience
+        # Epochs at the end that always get a full validation
+        self.full_tail = max(self.every, math.ceil(0.1 * num_epochs))
+        self.epochs_no_improve = 0
+        self.last_val_epoch = start_epoch - 1
+        self.best_loss = {}
+
+    def plan(self, epoch):
+        """FULL, SUBSET or None (skip validation) for this epoch."""
+        elapsed = epoch - self.last_val_epoch
+        final = epoch == self.num_epochs - 1
+        may_stop = self.epochs_no_improve + elapsed >= self.patience
+        if not (final or may_stop or (epoch + 1) % self.every == 0):
+            return None
+        if self.subsample and not may_stop and epoch < self.num_epochs - self.full_tail:
+            return SUBSET
+        return FULL
+
+    def record(self, epoch, kind, loss):
+        """Updates the patience counter; returns True if training should stop early."""
+        elapsed = epoch - self.last_val_epoch
+        self.last_val_epoch = epoch
+        best = self.best_loss.get(kind)
+        if best is None:
+            # First validation of this kind sets its baseline. Only the first of
+            # the run resets patience; the count from subset epochs is kept so
+            # the next full validation, compared against this one, decides.
+            if not self.best_loss:
+                self.epochs_no_improve = 0
+            self.best_loss[kind] = loss
+            return False
+        if loss < best:
+            self.epochs_no_improve = 0
+            self.best_loss[kind] = loss
+        else:
+            self.epochs_no_improve += elapsed
+        return kind == FULL and self.epochs_no_improve >= self.patience
@@ -0,0 +1,182 @@
+"""
+Long-lived worker for the quick backend commands.
+
+Serves the functions behind check_gpu.py, system_info.py,
+dataset_analyzer.py and tabular_processor.py from one interpreter, so torch,
+pandas and PIL are imported once instead of on every call. Speaks
+line-delimited JSON-RPC 2.0 over stdin/stdout: one request per line in, one
+response per line out. Requests run concurrently on a thread pool, so
+responses may arrive out of order and are matched by "id".
+
+  -> {"jsonrpc": "2.0", "id": 1, "method": "analyze_dataset", "params": {"path": "/data"}}
+  <- {"jsonrpc": "2.0", "id": 1, "result": {...same JSON the script prints...}}
+
+Methods:
+  ping                                    {"pong": true, "uptime_sec", "in_flight"}
+  get_gpu_info
+  get_system_info
+  analyze_dataset   path, decode_backend, verify
+  tabular.load      file
+  tabular.process   file, params, out
+  shutdown          Finishes in-flight requests, then exits
+
+Once the modules are imported a {"jsonrpc": "2.0", "method": "ready"}
+notification is written. Anything else the handlers print goes to stderr,
+so stdout only carries protocol messages. The worker exits when stdin closes.
+"""
+import sys
+import json
+import time
+import inspect
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+def _gpu_info():
+    from check_gpu import get_gpu_info
+    return get_gpu_info()
+
+
+def _system_info():
+    from system_info import get_system_info
+    return get_system_info()
+
+
+def _analyze_dataset(path, decode_backend='pil', verify=False):
+    from dataset_analyzer import analyze_dataset
+    return analyze_dataset(path, decode_backend, verify)
+
+
+def _tabular_load(file):
+    import tabular_processor
+    return tabular_processor.load(file)
+
+
+def _tabular_process(file, params, out=None):
+    import tabular_processor
+    return tabular_processor.process(file, params if isinstance(params, dict) else json.loads(params), out)
+
+
+METHODS = {
+    'get_gpu_info': _gpu_info,
+    'get_system_info': _system_info,
+    'analyze_dataset': _analyze_dataset,
+    'tabular.load': _tabular_load,
+    'tabular.process': _tabular_process,
+}
+
+# Imported at startup so the first request is as fast as the rest
+WARM_MODULES = ('torch', 'PIL.Image', 'pandas', 'psutil', 'check_gpu', 'system_info', 'dataset_analyzer', 'tabular_processor')
+
+
+class WorkerDaemon:
+    def __init__(self, out, workers=4):
+        self.out = out
+        self.write_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.started = time.time()
+        self.in_flight = 0
+        self.count_lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps({"jsonrpc": "2.0", **message})
+        with self.write_lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def reply(self, request_id, result=None, error=None):
+        if request_id is None:
+            return  # notifications get no response
+        if error is not None:
+            self.send({"id": request_id, "error": error})
+        else:
+            self.send({"id": request_id, "result": result})
+
+    def warm_up(self):
+        import importlib
+        for name in WARM_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                sys.stderr.write(f"worker_daemon: could not preload {name}: {e}\n")
+        self.send({"method": "ready", "params": {"startup_sec": round(time.time() - self.started, 2)}})
+
+    def _call(self, request_id, func, params):
+        args, kwargs = ((), params) if isinstance(params, dict) else (params, {})
+        try:
+            try:
+                inspect.signature(func).bind(*args, **kwargs)
+            except TypeError as e:
+                self.reply(request_id, error={"code": INVALID_PARAMS, "message": str(e)})
+                return
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.reply(request_id, error={"code": SERVER_ERROR, "message": str(e)})
+                return
+            self.reply(request_id, result)
+        finally:
+            with self.count_lock:
+                self.in_flight -= 1
+
+    def handle_line(self, line):
+        """Dispatches one request line; returns False on shutdown."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            self.send({"id": None, "error": {"code": PARSE_ERROR, "message": str(e)}})
+            return True
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            self.send({"id": None, "error": {"code": INVALID_REQUEST, "message": "Expected an object with a method."}})
+            return True
+
+        request_id = request.get('id')
+        method = request['method']
+        params = request.get('params') or {}
+        if method == 'ping':
+            self.reply(request_id, {"pong": True, "uptime_sec": round(time.time() - self.started, 1), "in_flight": self.in_flight})
+        elif method == 'shutdown':
+            self.pool.shutdown(wait=True)
+            self.reply(request_id, {"stopped": True})
+            return False
+        elif method not in METHODS:
+            self.reply(request_id, error={"code": METHOD_NOT_FOUND, "message": f"Unknown method: {method}"})
+        else:
+            with self.count_lock:
+                self.in_flight += 1
+            self.pool.submit(self._call, request_id, METHODS[method], params)
+        return True
+
+    def serve(self, stdin):
+        for line in stdin:
+            if line.strip() and not self.handle_line(line):
+                return
+        self.pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EPOQ backend worker (JSON-RPC over stdin/stdout)')
+    parser.add_argument('--workers', type=int, default=4, help='Requests served concurrently')
+    parser.add_argument('--no_warmup', action='store_true', help='Import modules on first use instead of at startup')
+    args = parser.parse_args()
+
+    # Protocol messages only on the real stdout; handler output goes to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    daemon = WorkerDaemon(out, args.workers)
+    if args.no_warmup:
+        daemon.send({"method": "ready", "params": {"startup_sec": 0.0}})
+    else:
+        daemon.warm_up()
+    daemon.serve(sys.stdin)
+
+
+if __name__ == '__main__':
+    main()